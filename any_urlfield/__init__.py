@@ -1,5 +1,10 @@
+import django
+
 # following PEP 440
 __version__ = "2.7.post1"
 
 # Values starting with such prefix should be handled as external URL.
 EXTERNAL_SCHEMES = ('http', 'https', 'ftp', 'ftps', 'sftp', 'webdav', 'webdavs', 'afp', 'smb', 'git', 'svn', 'hg', 'mailto', 'tel')
+
+if django.VERSION < (3, 2):
+    default_app_config = 'any_urlfield.apps.AnyUrlFieldConfig'
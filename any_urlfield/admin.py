@@ -0,0 +1,62 @@
+"""
+Admin integration of the URL field.
+"""
+from django.core.exceptions import FieldDoesNotExist
+
+from any_urlfield.forms import prefetch_raw_id_objects
+from any_urlfield.models import AnyUrlField, AnyUrlValue
+
+
+class AnyUrlFieldAdminMixin:
+    """
+    A mixin for ``ModelAdmin`` classes, that fetches the objects of the
+    :class:`~any_urlfield.forms.SimpleRawIdWidget` widgets with a single query per model.
+
+    This covers the change form, its inlines, and the ``list_editable`` forms of the changelist.
+    The URLs that the changelist displays are generated in bulk too:
+
+    .. code-block:: python
+
+        @admin.register(Article)
+        class ArticleAdmin(AnyUrlFieldAdminMixin, admin.ModelAdmin):
+            inlines = [LinkInline]
+    """
+
+    def render_change_form(self, request, context, *args, **kwargs):
+        forms = []
+        adminform = context.get('adminform')
+        if adminform is not None:
+            forms.append(adminform.form)
+        for inline_admin_formset in context.get('inline_admin_formsets', ()):
+            forms.extend(inline_admin_formset.formset.forms)
+
+        prefetch_raw_id_objects(forms)
+        return super().render_change_form(request, context, *args, **kwargs)
+
+    def changelist_view(self, request, extra_context=None):
+        response = super().changelist_view(request, extra_context=extra_context)
+
+        # The response is rendered later, so the forms and objects can still be prepared.
+        cl = (getattr(response, 'context_data', None) or {}).get('cl')
+        if cl is None:
+            return response
+
+        formset = getattr(cl, 'formset', None)
+        if formset is not None:
+            prefetch_raw_id_objects(formset.forms)
+
+        # The columns display the URLs, generate these with a single query per model.
+        field_names = [
+            name for name in cl.list_display
+            if isinstance(name, str) and isinstance(_get_field(cl.model, name), AnyUrlField)
+        ]
+        if field_names:
+            AnyUrlValue.render_urls([getattr(obj, name) for obj in cl.result_list for name in field_names])
+        return response
+
+
+def _get_field(model, name):
+    try:
+        return model._meta.get_field(name)
+    except FieldDoesNotExist:
+        return None
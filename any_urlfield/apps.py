@@ -0,0 +1,15 @@
+from django.apps import AppConfig
+
+
+class AnyUrlFieldConfig(AppConfig):
+    name = 'any_urlfield'
+    verbose_name = "Any URL field"
+
+    def ready(self):
+        from any_urlfield import appsettings
+        from any_urlfield.models import AnyUrlField
+
+        if appsettings.ANY_URLFIELD_FREEZE_REGISTRY:
+            # All models.py files are imported at this point,
+            # so all register_model() calls should have happened.
+            AnyUrlField._static_registry.freeze()
@@ -0,0 +1,70 @@
+"""
+Overview of all settings which can be customized.
+"""
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS
+from django.core.exceptions import ImproperlyConfigured
+
+# Make the URL type registry read-only once all apps are loaded.
+ANY_URLFIELD_FREEZE_REGISTRY = getattr(settings, 'ANY_URLFIELD_FREEZE_REGISTRY', False)
+
+# The number of parsed database values to keep in memory (per registry).
+ANY_URLFIELD_PARSE_CACHE_SIZE = getattr(settings, 'ANY_URLFIELD_PARSE_CACHE_SIZE', 2048)
+
+# Parse the database value of all AnyUrlField's only on first access.
+# Note that values() and values_list() queries return the raw database string for lazy fields.
+ANY_URLFIELD_LAZY = getattr(settings, 'ANY_URLFIELD_LAZY', False)
+
+# Resolve the objects of all values loaded by the same query, when one of them is accessed.
+ANY_URLFIELD_AUTO_RESOLVE = getattr(settings, 'ANY_URLFIELD_AUTO_RESOLVE', False)
+
+# Only render the form widget of the selected URL type, the others are fetched when the user selects their type.
+ANY_URLFIELD_LAZY_WIDGET = getattr(settings, 'ANY_URLFIELD_LAZY_WIDGET', False)
+
+# The cache to store the generated URLs in, can be overwritten per URL type.
+ANY_URLFIELD_CACHE_ALIAS = getattr(settings, 'ANY_URLFIELD_CACHE_ALIAS', DEFAULT_CACHE_ALIAS)
+
+# How long generated URLs are cached, can be overwritten per URL type.
+ANY_URLFIELD_CACHE_TIMEOUT = getattr(settings, 'ANY_URLFIELD_CACHE_TIMEOUT', 3600)
+
+# How long to remember that the object of a link doesn't exist (0 disables it).
+ANY_URLFIELD_NEGATIVE_CACHE_TIMEOUT = getattr(settings, 'ANY_URLFIELD_NEGATIVE_CACHE_TIMEOUT', 60)
+
+# Let only one thread or process generate a missing URL, the others wait for the result.
+ANY_URLFIELD_CACHE_SINGLE_FLIGHT = getattr(settings, 'ANY_URLFIELD_CACHE_SINGLE_FLIGHT', False)
+
+# How long other callers wait for a URL that is being generated (also the lease timeout).
+ANY_URLFIELD_CACHE_LOCK_TIMEOUT = getattr(settings, 'ANY_URLFIELD_CACHE_LOCK_TIMEOUT', 5)
+
+# The number of URLs to keep in an in-process cache, in front of the Django cache (0 disables it).
+ANY_URLFIELD_LOCAL_CACHE_SIZE = getattr(settings, 'ANY_URLFIELD_LOCAL_CACHE_SIZE', 0)
+
+# The maximum age of URLs in the in-process cache.
+ANY_URLFIELD_LOCAL_CACHE_TIMEOUT = getattr(settings, 'ANY_URLFIELD_LOCAL_CACHE_TIMEOUT', 60)
+
+# Use a short hash of the model name in the cache keys.
+ANY_URLFIELD_CACHE_KEY_HASH = getattr(settings, 'ANY_URLFIELD_CACHE_KEY_HASH', False)
+
+# How cached URLs are invalidated when an object is saved:
+# - 'delete' removes the keys of the object in all languages.
+# - 'generation' increments a counter for the model, which is part of all cache keys.
+#   This is a single cache call, but saving any object invalidates the cached URLs of all objects of the model.
+#   Use it for models whose URLs depend on each other (e.g. page trees), or that are rarely saved.
+#   Building a cache key reads the counter first, which is an extra cache round-trip for each URL
+#   that isn't remembered yet. With ANY_URLFIELD_LOCAL_CACHE_SIZE, the counter is kept in-process too,
+#   so other processes see an increment after ANY_URLFIELD_LOCAL_CACHE_TIMEOUT.
+ANY_URLFIELD_CACHE_INVALIDATION = getattr(settings, 'ANY_URLFIELD_CACHE_INVALIDATION', 'delete')
+
+if ANY_URLFIELD_CACHE_INVALIDATION not in ('delete', 'generation'):
+    raise ImproperlyConfigured("ANY_URLFIELD_CACHE_INVALIDATION should be 'delete' or 'generation'.")
+
+# With write-through, only generate the URLs again in the languages that are cached,
+# instead of all languages of the object. The cached URLs are read with a single get_many() call first.
+# This doesn't limit the invalidation: saving an object always removes the keys of all its languages.
+ANY_URLFIELD_CACHE_WRITE_CACHED_LANGUAGES_ONLY = getattr(
+    settings, 'ANY_URLFIELD_CACHE_WRITE_CACHED_LANGUAGES_ONLY', False
+)
+
+# Write the new URLs of an object to the cache when it's saved, instead of only removing them.
+# The URLs are written when the transaction commits. Objects that are loaded from fixtures are only removed.
+ANY_URLFIELD_CACHE_WRITE_THROUGH = getattr(settings, 'ANY_URLFIELD_CACHE_WRITE_THROUGH', False)
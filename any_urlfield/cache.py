@@ -1,28 +1,157 @@
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from hashlib import md5
+
 from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, caches
 from django.utils.translation import get_language
 
+from any_urlfield import appsettings
+
 _ALL_LANGUAGE_CODES = [code for code, title in settings.LANGUAGES]
 
+# Memcached supports keys up to 250 characters,
+# this leaves room for the KEY_PREFIX and VERSION of the cache settings.
+MAX_KEY_LENGTH = 200
+
+_key_prefixes = {}
+_key_locks = {}  # key -> [lock, number of users]
+_key_locks_lock = threading.Lock()
 
-def get_urlfield_cache_key(model, pk, language_code=None):
+
+def get_urlfield_cache_key(model, pk, language_code=None, cache_alias=None):
     """
     The low-level function to get the cache key for a model.
+    The ``cache_alias`` is only used to read the generation counter.
+    """
+    return _make_key(_get_object_key_prefix(model, cache_alias), pk, language_code or get_language())
+
+
+def get_urlfield_cache_keys(model, pks, language_code=None, cache_alias=None):
+    """
+    Return the cache keys for multiple objects of the same model.
+    """
+    prefix = _get_object_key_prefix(model, cache_alias)
+    language_code = language_code or get_language()
+    return [_make_key(prefix, pk, language_code) for pk in pks]
+
+
+def get_urlfield_language_keys(model, pk, languages, cache_alias=None):
+    """
+    Return the cache keys of a single object in multiple languages, as ``{language_code: key}`` dictionary.
     """
-    return 'anyurlfield.{}.{}.{}.{}'.format(model._meta.app_label, model.__name__, pk, language_code or get_language())
+    prefix = _get_object_key_prefix(model, cache_alias)
+    return {language: _make_key(prefix, pk, language) for language in languages}
 
 
-def get_object_cache_keys(instance):
+def get_object_cache_keys(instance, cache_alias=None):
     """
     Return the cache keys associated with an object.
     """
     if not instance.pk or instance._state.adding:
         return []
 
-    keys = []
-    for language in _get_available_languages(instance):
-        keys.append(get_urlfield_cache_key(instance.__class__, instance.pk, language))
+    # All languages, reading the cached ones first would not save a round trip.
+    languages = _get_available_languages(instance)
+    return list(get_urlfield_language_keys(instance.__class__, instance.pk, languages, cache_alias).values())
 
-    return keys
+
+def get_objects_cache_keys(model, pks, cache_alias=None):
+    """
+    Return the cache keys associated with many objects of the same model.
+    Unlike :func:`get_object_cache_keys`, this doesn't ask the objects for their languages,
+    it uses all configured languages.
+    """
+    prefix = _get_object_key_prefix(model, cache_alias)
+    return [_make_key(prefix, pk, language) for pk in pks for language in _ALL_LANGUAGE_CODES]
+
+
+def get_object_languages(instance, cache_alias=None):
+    """
+    Return the languages to write the URL of an object in.
+    With ``ANY_URLFIELD_CACHE_WRITE_CACHED_LANGUAGES_ONLY``, these are the languages that are actually cached.
+    """
+    if appsettings.ANY_URLFIELD_CACHE_WRITE_CACHED_LANGUAGES_ONLY:
+        return get_cached_languages(instance.__class__, [instance.pk], cache_alias).get(instance.pk, set())
+    return _get_available_languages(instance)
+
+
+def get_cached_languages(model, pks, cache_alias=None):
+    """
+    Return the languages in which the URLs of the objects are cached, as ``{pk: set}`` dictionary.
+    This allows monitoring the cache footprint of a model.
+    Objects without any cached URL are not included.
+
+    The cached URLs are the index themselves, so this reads the keys of all configured languages at once.
+    """
+    prefix = _get_object_key_prefix(model, cache_alias)
+    keys = {_make_key(prefix, pk, language): (pk, language) for pk in pks for language in _ALL_LANGUAGE_CODES}
+    cached_languages = {}
+    for key in get_url_cache(cache_alias).get_many(list(keys)):
+        pk, language = keys[key]
+        cached_languages.setdefault(pk, set()).add(language)
+    return cached_languages
+
+
+def get_cache_generation(model, cache_alias=None):
+    """
+    Return the generation of the cached URLs for a model.
+    This is part of the cache keys when ``ANY_URLFIELD_CACHE_INVALIDATION = 'generation'`` is used.
+    """
+    url_cache = get_url_cache(cache_alias)
+    key = _get_key_prefix(model) + 'generation'
+    generation = url_cache.get(key)
+    if generation is None:
+        # Start at the current time, so a counter that is evicted from the cache
+        # doesn't restart at a value that older entries still use.
+        generation = int(time.time() * 1000)
+        if not url_cache.add(key, generation):
+            generation = url_cache.get(key) or generation
+    return generation
+
+
+def bump_cache_generation(model, cache_alias=None):
+    """
+    Invalidate all cached URLs of a model at once.
+    The previous entries are no longer read, and expire by themselves.
+    """
+    url_cache = get_url_cache(cache_alias)
+    key = _get_key_prefix(model) + 'generation'
+    try:
+        url_cache.incr(key)
+    except ValueError:
+        url_cache.add(key, int(time.time() * 1000))
+
+
+def _get_object_key_prefix(model, cache_alias=None):
+    prefix = _get_key_prefix(model)
+    if appsettings.ANY_URLFIELD_CACHE_INVALIDATION == 'generation':
+        prefix += 'g{}.'.format(get_cache_generation(model, cache_alias))
+    return prefix
+
+
+def _get_key_prefix(model):
+    # The prefix is constant per model, avoid formatting it every time.
+    try:
+        return _key_prefixes[model]
+    except KeyError:
+        name = '{}.{}'.format(model._meta.app_label, model.__name__)
+        if appsettings.ANY_URLFIELD_CACHE_KEY_HASH:
+            name = md5(name.encode()).hexdigest()[:8]
+        prefix = 'anyurlfield.{}.'.format(name)
+        _key_prefixes[model] = prefix
+        return prefix
+
+
+def _make_key(prefix, pk, language_code):
+    # The language_code is None when translations are deactivated.
+    key = prefix + str(pk) + '.' + str(language_code)
+    if len(key) > MAX_KEY_LENGTH:
+        # Very long primary keys, keep the key valid for memcached.
+        key = 'anyurlfield.' + md5(key.encode()).hexdigest()
+    return key
 
 
 def _get_available_languages(instance):
@@ -30,3 +159,250 @@ def _get_available_languages(instance):
         return instance.get_available_languages()  # django-parler
     except AttributeError:
         return _ALL_LANGUAGE_CODES
+
+
+class LocalUrlCache:
+    """
+    In-process cache for URLs, bounded by the number of entries and their age.
+    The least recently used entries are removed first.
+    """
+
+    def __init__(self, max_entries, timeout):
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()  # key -> (expires, value)
+        self._lock = threading.Lock()
+
+    def get_many(self, keys):
+        """
+        Return the dictionary of keys that are found.
+        """
+        now = time.monotonic()
+        found = {}
+        with self._lock:
+            for key in keys:
+                try:
+                    expires, value = self._data[key]
+                except KeyError:
+                    self.misses += 1
+                    continue
+
+                if expires < now:
+                    del self._data[key]
+                    self.misses += 1
+                else:
+                    self._data.move_to_end(key)
+                    found[key] = value
+                    self.hits += 1
+        return found
+
+    def set_many(self, data, timeout=None):
+        """
+        Store the values. The ``timeout`` can only shorten the configured timeout.
+        """
+        if timeout is None or timeout > self.timeout:
+            timeout = self.timeout
+        expires = time.monotonic() + timeout
+
+        with self._lock:
+            for key, value in data.items():
+                self._data[key] = (expires, value)
+                self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete_many(self, keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def get_stats(self):
+        """
+        Return the usage statistics, for monitoring.
+        """
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'entries': len(self._data),
+            'max_entries': self.max_entries,
+        }
+
+
+class UrlCache:
+    """
+    The cache for generated URLs.
+
+    This stores the URLs in a Django cache backend.
+    Optionally, a :class:`LocalUrlCache` is used in front of it to avoid network round-trips.
+    Note that the local cache is only invalidated in the process that saves the object,
+    other processes may return the previous URL until the local timeout passes.
+    """
+
+    def __init__(self, alias=DEFAULT_CACHE_ALIAS, local_cache=None):
+        self.alias = alias
+        self.local_cache = local_cache
+
+    @property
+    def backend(self):
+        # Not storing this, as the connections are thread-local.
+        return caches[self.alias]
+
+    def get(self, key):
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys):
+        if self.local_cache is None:
+            return self.backend.get_many(keys)
+
+        found = self.local_cache.get_many(keys)
+        if len(found) < len(keys):
+            missing = [key for key in keys if key not in found]
+            remote = self.backend.get_many(missing)
+            if remote:
+                self.local_cache.set_many(remote)
+                found.update(remote)
+        return found
+
+    async def aget_many(self, keys):
+        backend = self.backend
+        if not hasattr(backend, 'aget_many'):
+            # Django < 4.0 has no async cache API.
+            from asgiref.sync import sync_to_async
+            return await sync_to_async(self.get_many)(keys)
+
+        if self.local_cache is None:
+            return await backend.aget_many(keys)
+
+        found = self.local_cache.get_many(keys)
+        if len(found) < len(keys):
+            missing = [key for key in keys if key not in found]
+            remote = await backend.aget_many(missing)
+            if remote:
+                self.local_cache.set_many(remote)
+                found.update(remote)
+        return found
+
+    def set(self, key, value, timeout):
+        self.set_many({key: value}, timeout)
+
+    def set_many(self, data, timeout):
+        self.backend.set_many(data, timeout)
+        if self.local_cache is not None:
+            self.local_cache.set_many(data, timeout)
+
+    async def aset_many(self, data, timeout):
+        backend = self.backend
+        if not hasattr(backend, 'aset_many'):
+            from asgiref.sync import sync_to_async
+            return await sync_to_async(self.set_many)(data, timeout)
+
+        await backend.aset_many(data, timeout)
+        if self.local_cache is not None:
+            self.local_cache.set_many(data, timeout)
+
+    def delete_many(self, keys):
+        if self.local_cache is not None:
+            self.local_cache.delete_many(keys)
+        self.backend.delete_many(keys)
+
+    def add(self, key, value, timeout=None):
+        # Only used for counters, that never expire by default.
+        added = self.backend.add(key, value, timeout)
+        if added and self.local_cache is not None:
+            self.local_cache.set_many({key: value}, timeout)
+        return added
+
+    def incr(self, key):
+        if self.local_cache is not None:
+            self.local_cache.delete_many([key])
+        return self.backend.incr(key)
+
+
+def single_flight(cache_key, generate, cache_alias=None):
+    """
+    Return the cached URL, or let a single caller generate it.
+
+    Within the process, other threads wait for the result.
+    Across processes, a cache ``add()`` acts as lease, and the other processes
+    poll the cache for the result until the lease times out.
+    The ``generate`` function should store the URL in the cache itself.
+    """
+    url_cache = get_url_cache(cache_alias)
+    lock_timeout = appsettings.ANY_URLFIELD_CACHE_LOCK_TIMEOUT
+    with _lock_key(cache_key, lock_timeout) as locked:
+        # Another thread may have generated it while waiting.
+        url = url_cache.get(cache_key)
+        if url or not locked:
+            # When the other thread takes too long, generate it anyway.
+            return url or generate()
+
+        backend = url_cache.backend
+        lease_key = cache_key + '.lease'
+        if backend.add(lease_key, 1, lock_timeout):
+            try:
+                return generate()
+            finally:
+                backend.delete(lease_key)
+
+        # Another process is generating the URL.
+        deadline = time.monotonic() + lock_timeout
+        while time.monotonic() < deadline:
+            time.sleep(0.05)
+            url = url_cache.get(cache_key)
+            if url:
+                return url
+
+        # Taking too long, generate it anyway.
+        return generate()
+
+
+@contextmanager
+def _lock_key(key, timeout):
+    # Yields whether the lock was acquired within the timeout.
+    with _key_locks_lock:
+        entry = _key_locks.setdefault(key, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        locked = entry[0].acquire(timeout=timeout)
+        try:
+            yield locked
+        finally:
+            if locked:
+                entry[0].release()
+    finally:
+        with _key_locks_lock:
+            entry[1] -= 1
+            if not entry[1]:
+                del _key_locks[key]
+
+
+def _get_local_cache():
+    if appsettings.ANY_URLFIELD_LOCAL_CACHE_SIZE:
+        return LocalUrlCache(appsettings.ANY_URLFIELD_LOCAL_CACHE_SIZE, appsettings.ANY_URLFIELD_LOCAL_CACHE_TIMEOUT)
+    return None
+
+
+def get_url_cache(cache_alias=None):
+    """
+    Return the URL cache for a cache alias, by default ``ANY_URLFIELD_CACHE_ALIAS``.
+    The in-process cache is shared by all aliases, as the keys don't overlap.
+    """
+    if cache_alias is None:
+        return url_cache
+
+    try:
+        return _url_caches[cache_alias]
+    except KeyError:
+        return _url_caches.setdefault(cache_alias, UrlCache(cache_alias, local_cache=url_cache.local_cache))
+
+
+url_cache = UrlCache(appsettings.ANY_URLFIELD_CACHE_ALIAS, local_cache=_get_local_cache())
+_url_caches = {url_cache.alias: url_cache}
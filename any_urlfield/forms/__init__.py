@@ -1,7 +1,8 @@
-from .fields import AnyUrlField
-from .widgets import AnyUrlWidget, SimpleRawIdWidget
+from .fields import AnyUrlField, prefetch_raw_id_objects
+from .widgets import AnyUrlWidget, SearchSelectWidget, SimpleRawIdWidget, shared_choices
 
 __all__ = (
     'AnyUrlField',
-    'AnyUrlWidget', 'SimpleRawIdWidget',
+    'AnyUrlWidget', 'SearchSelectWidget', 'SimpleRawIdWidget',
+    'prefetch_raw_id_objects', 'shared_choices',
 )
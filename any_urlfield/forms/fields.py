@@ -1,6 +1,8 @@
 """
 Custom form fields for URLs
 """
+import copy
+
 import django
 from django import forms
 from django.core import validators
@@ -9,7 +11,7 @@ from django.db.models.base import Model
 from django.forms.utils import ErrorList
 from django.utils.translation import gettext_lazy as _
 
-from any_urlfield.forms.widgets import AnyUrlWidget
+from any_urlfield.forms.widgets import AnyUrlWidget, SimpleRawIdWidget
 from any_urlfield.validators import ExtendedURLValidator
 
 
@@ -24,28 +26,40 @@ class AnyUrlField(forms.MultiValueField):
 
     def __init__(self, url_type_registry, max_length=None, *args, **kwargs):
         self.url_type_registry = url_type_registry  # UrlTypeRegistry object
+        prototype = url_type_registry.get_form_prototype()
 
         # Build fields,
         # these have to match the widget.
         fields = []
-        choices = []
-        for urltype in self.url_type_registry:
-            # Get formfield, update properties
-            field = urltype.get_form_field()
-            field.required = False   # Delay check, happens somewhere else.
+        for index in range(len(prototype.fields)):
+            # Copy the formfield, update properties
+            field = prototype.copy_field(index)
             if getattr(field, 'max_length', None) and field.max_length > max_length:
                 field.max_length = max_length
-
             fields.append(field)
-            choices.append((urltype.prefix, urltype.title))
+
+        choices = prototype.choices
         fields.insert(0, forms.ChoiceField(label=_("Type URL"), choices=choices, initial=choices[0][0]))
 
         # Instantiate widget. Is not done by parent at all.
-        widget = self.widget(url_type_registry=url_type_registry)
-        kwargs['widget'] = widget
+        # The widget of the prototype is copied by the parent.
+        if self.widget is AnyUrlWidget:
+            kwargs['widget'] = prototype.widget
+        else:
+            kwargs['widget'] = self.widget(url_type_registry=url_type_registry)
         kwargs.pop('empty_value', None)  # for Django 1.11
         super().__init__(fields, *args, **kwargs)
 
+        # The copied subwidgets still iterate the choices of the prototype fields.
+        # Evaluating such a shared queryset (e.g. with prefetch_related()) would cache its objects for all forms,
+        # hence the subwidgets use the fields of this form instead.
+        for index, field in enumerate(fields[1:]):
+            widget = self.widget.widgets[index + 1]
+            if not prototype.url_types[index].shared_form_field:
+                self.widget.widgets[index + 1] = prototype.url_types[index].get_widget(field)
+            elif hasattr(widget, 'choices') and hasattr(field, 'choices'):
+                widget.choices = field.choices
+
     def compress(self, data_list):
         # Reimporting models from froms is tricky, and may lead to circular ImportErrors
         # Hence, importing here locally.
@@ -66,14 +80,21 @@ class AnyUrlField(forms.MultiValueField):
             if type_prefix == 'http':
                 return AnyUrlValue(type_prefix, value, self.url_type_registry)
             else:
+                object = None
                 if urltype.has_id_value:
                     if isinstance(value, Model):
+                        object = value
                         value = value.pk   # Auto cast foreign keys to integer.
                     elif value:
                         value = int(value)
                     else:
                         return None
-                return AnyUrlValue(type_prefix, value, self.url_type_registry)
+
+                url_value = AnyUrlValue(type_prefix, value, self.url_type_registry)
+                if object is not None:
+                    # The form field already fetched the object, model validation can reuse it.
+                    url_value._set_resolved_objects({value: object})
+                return url_value
         return None
 
     def clean(self, value):
@@ -127,6 +148,95 @@ class AnyUrlField(forms.MultiValueField):
         return super().has_changed(initial, data)
 
 
+class AnyUrlFieldPrototype:
+    """
+    The form fields and widgets of all URL types in a registry.
+    This is built once by :func:`UrlTypeRegistry.get_form_prototype() <any_urlfield.registry.UrlTypeRegistry.get_form_prototype>`,
+    and copied by every :class:`AnyUrlField`.
+    """
+
+    def __init__(self, url_type_registry):
+        self.url_types = list(url_type_registry)
+        self.fields = []
+        self.widgets = []
+        self.choices = []
+        for urltype in url_type_registry:
+            field = urltype.get_form_field()
+            field.required = False   # Delay check, happens somewhere else.
+            self.fields.append(field)
+            self.widgets.append(urltype.get_widget(field))
+            self.choices.append((urltype.prefix, urltype.title))
+
+        self.widget = AnyUrlWidget(url_type_registry, url_widgets=self.widgets)
+
+    def copy_field(self, index):
+        """
+        Return the form field of a URL type for a single form.
+        A shared form field instance is copied, a ``form_field`` callable is called again.
+        """
+        urltype = self.url_types[index]
+        if urltype.shared_form_field:
+            return copy.deepcopy(self.fields[index])
+
+        field = urltype.get_form_field()
+        field.required = False
+        return field
+
+    def copy_widget(self, index):
+        """
+        Return the widget of a URL type for a single form.
+        This uses a copy of the form field, so the choices don't evaluate the queryset of the prototype.
+        """
+        return self.url_types[index].get_widget(self.copy_field(index))
+
+
+def prefetch_raw_id_objects(forms):
+    """
+    Fetch the objects that the :class:`~any_urlfield.forms.SimpleRawIdWidget` widgets of these forms display,
+    using a single query per model.
+
+    Call this with the forms of a formset (e.g. ``formset.forms``) before rendering them.
+    Otherwise, each raw ID widget queries its own object.
+    """
+    pks = {}      # (model, db) -> set of ID's
+    widgets = {}  # (model, db) -> widgets
+    for form in forms:
+        for name, field in form.fields.items():
+            if not isinstance(field, AnyUrlField):
+                continue
+
+            value = form[name].value()
+            if not isinstance(value, list):
+                value = field.widget.decompress(value)
+
+            for i, widget in enumerate(field.widget.widgets):
+                if not isinstance(widget, SimpleRawIdWidget):
+                    continue
+
+                key = (widget.rel.model, widget.db)
+                widgets.setdefault(key, []).append(widget)
+                try:
+                    widget_value = value[i]
+                except IndexError:
+                    continue
+                if widget_value in validators.EMPTY_VALUES:
+                    continue
+
+                try:
+                    pk = widget.rel.model._meta.pk.to_python(str(widget_value))
+                except ValidationError:
+                    continue  # Invalid input renders without label.
+                pks.setdefault(key, set()).add(pk)
+
+    for key, model_widgets in widgets.items():
+        model, db = key
+        objects = {}
+        if pks.get(key):
+            objects = {str(pk): obj for pk, obj in model._default_manager.using(db).in_bulk(pks[key]).items()}
+        for widget in model_widgets:
+            widget.prefetched_objects = objects
+
+
 class ExtendedURLField(forms.URLField):
     """
     An URL field that also supports validating ``tel:`` and ``mailto:`` links.
@@ -3,22 +3,37 @@ Custom widgets used by the URL form fields.
 """
 
 import re
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+from urllib.parse import quote, urlencode
 
 from django.contrib import admin
 from django.contrib.admin.widgets import ForeignKeyRawIdWidget
-from django.core.exceptions import ValidationError
+from django.core import signing
+from django.core.exceptions import EmptyResultSet, ImproperlyConfigured, ValidationError
+from django.core.signals import setting_changed
+from django.core.validators import EMPTY_VALUES
 from django.db.models.fields.related import ManyToOneRel
+from django.dispatch import receiver
 from django.forms import widgets
+from django.forms.renderers import get_default_renderer
 from django.forms.utils import flatatt
 from django.template.defaultfilters import slugify
-from django.urls import reverse, NoReverseMatch  # Django 1.10+
+from django.urls import get_script_prefix, get_urlconf, reverse, NoReverseMatch  # Django 1.10+
 from django.utils.encoding import force_str
 from django.utils.html import escape
+from django.utils.http import RFC3986_SUBDELIMS
 from django.utils.safestring import mark_safe
 from django.utils.text import Truncator
 
+from any_urlfield import appsettings
+from any_urlfield.middleware import context_middleware
 
 RE_CLEANUP_CLASS = re.compile('[^a-z0-9-_]')
+RENDER_WIDGET_SALT = 'any_urlfield.render_widget'
+
+_shared_choices = ContextVar('any_urlfield_shared_choices', default=None)
 
 
 class UrlTypeSelect(widgets.RadioSelect):
@@ -48,19 +63,27 @@ class AnyUrlWidget(widgets.MultiWidget):
         js = ('any_urlfield/any_urlfield.js',)
         css = {'all': ('any_urlfield/any_urlfield.css',)}
 
-    def __init__(self, url_type_registry, attrs=None):
+    def __init__(self, url_type_registry, attrs=None, url_widgets=None, lazy=None):
+        """
+        With ``lazy=True``, only the subwidget of the selected URL type is rendered.
+        The others are fetched from the ``any_urlfield.views.render_widget`` view when the user selects their type.
+        By default, the ``ANY_URLFIELD_LAZY_WIDGET`` setting is used.
+        """
         type_choices = [(urltype.prefix, urltype.title) for urltype in url_type_registry]
 
         # Expose sub widgets for form field.
         self.url_type_registry = url_type_registry
         self.url_type_widget = UrlTypeSelect(choices=type_choices)
         self.url_widgets = []
+        self.lazy = lazy
 
         # Combine to list, ensure order of values list later.
-        subwidgets = []
-        for urltype in url_type_registry:
-            widget = urltype.get_widget()
-            subwidgets.append(widget)
+        if url_widgets is None:
+            # Copy the widgets that the registry already built, as these are shared.
+            prototype = url_type_registry.get_form_prototype()
+            subwidgets = [prototype.copy_widget(index) for index in range(len(prototype.widgets))]
+        else:
+            subwidgets = list(url_widgets)
 
         subwidgets.insert(0, self.url_type_widget)
 
@@ -94,15 +117,24 @@ class AnyUrlWidget(widgets.MultiWidget):
         return result
 
     def get_context(self, name, value, attrs):
-        context = super().get_context(name, value, attrs)
-
-        # BEGIN Django 1.11 code!
+        # Decompress first, formatting the AnyUrlValue as context value would generate its URL.
         if not isinstance(value, list):
             value = self.decompress(value)
 
+        # Skip MultiWidget.get_context(), the subwidgets are rendered below.
+        context = widgets.Widget.get_context(self, name, value, attrs)
+
+        # BEGIN Django 1.11 code!
+        if self.is_localized:
+            for widget in self.widgets:
+                widget.is_localized = self.is_localized
+
         final_attrs = context['widget']['attrs']
         input_type = final_attrs.pop('type', None)
         id_ = final_attrs.get('id')
+        shared_choices = _shared_choices.get()
+        url_types = list(self.url_type_registry)
+        lazy = (appsettings.ANY_URLFIELD_LAZY_WIDGET if self.lazy is None else self.lazy) and self._is_view_registry()
         subwidgets = []
         for i, widget in enumerate(self.widgets):
             if input_type is not None:
@@ -119,17 +151,151 @@ class AnyUrlWidget(widgets.MultiWidget):
                 widget_attrs = final_attrs
 
             # FIX Django 1.11 "bug" of lost context for fields!
-            subwidgets.append(widget.get_context(widget_name, widget_value, widget_attrs))
+            if lazy and i > 0 and url_types[i - 1].prefix != value[0] and widget_value in EMPTY_VALUES:
+                # Hidden panes are fetched when the user selects their type.
+                widget_context = _get_placeholder_context(url_types[i - 1], i, widget_name, final_attrs)
+            elif shared_choices is not None and _is_shared_select(widget):
+                widget_context = _get_shared_select_context(shared_choices, widget, widget_name, widget_value, widget_attrs)
+            else:
+                widget_context = widget.get_context(widget_name, widget_value, widget_attrs)
+            subwidgets.append(widget_context)
         context['widget']['subwidgets'] = subwidgets
         # END
 
         # Each subwidget corresponds with an registered URL type.
         # Make sure the template can render the proper ID's for JavaScript.
-        for i, urltype in enumerate(self.url_type_registry):
+        for i, urltype in enumerate(url_types):
             subwidgets[i + 1]['prefix'] = RE_CLEANUP_CLASS.sub('', urltype.prefix)
 
         return context
 
+    def _is_view_registry(self):
+        # The render_widget view can only render the widgets of the model field registry,
+        # the widgets of other registries are always rendered.
+        from any_urlfield.models import AnyUrlField
+        return self.url_type_registry is AnyUrlField._static_registry
+
+
+def _get_placeholder_context(url_type, index, name, attrs):
+    try:
+        url = reverse('any_urlfield:render_widget', args=(url_type.prefix,))
+    except NoReverseMatch:
+        raise ImproperlyConfigured("The lazy AnyUrlWidget requires 'any_urlfield.urls' in the URLconf.")
+
+    # The name and ID are added by the JavaScript, as formsets renumber the fields.
+    # Other attributes (e.g. disabled) are passed to the view, signed so they can't be altered.
+    attrs = {key: value if isinstance(value, bool) else force_str(value) for key, value in attrs.items() if key != 'id'}
+    if attrs:
+        url += '?' + urlencode({'attrs': signing.dumps(attrs, salt=RENDER_WIDGET_SALT)})
+
+    return {
+        'widget': {
+            'name': name,
+            'index': index,
+            'url': url,
+            'template_name': 'any_urlfield/widgets/placeholder.html',
+        }
+    }
+
+
+class SharedOptions:
+    """
+    The evaluated choices of a select widget, and the rendered HTML of each ``<option>``.
+    These are shared by all copies of the widget within :func:`shared_choices`.
+    """
+
+    def __init__(self, widget):
+        self.choices = [choice for choice in widget.choices]  # list() would also run a COUNT query.
+        self.html = None  # Not supported for option groups.
+        self._widget = widget
+        self._renderer = get_default_renderer()
+        self._selected_html = {}
+        self._indexes = {}
+
+        if not any(isinstance(label, (list, tuple)) for value, label in self.choices):
+            self.html = []
+            for index, (value, label) in enumerate(self.choices):
+                self._indexes.setdefault('' if value is None else str(value), index)
+                self.html.append(self._render_option(index, selected=False))
+
+    def _render_option(self, index, selected):
+        value, label = self.choices[index]
+        option = self._widget.create_option(None, '' if value is None else value, label, selected, index)
+        return mark_safe(self._renderer.render(option['template_name'], {'widget': option}))
+
+    def render(self, selected_values):
+        """
+        Return the HTML of all options, with the first matching option selected.
+        """
+        indexes = [self._indexes[value] for value in selected_values if value in self._indexes]
+        if not indexes:
+            return mark_safe('\n'.join(self.html))
+
+        index = min(indexes)
+        try:
+            selected_html = self._selected_html[index]
+        except KeyError:
+            selected_html = self._selected_html[index] = self._render_option(index, selected=True)
+
+        html = list(self.html)
+        html[index] = selected_html
+        return mark_safe('\n'.join(html))
+
+
+def _is_shared_select(widget):
+    # Only the standard select of a ModelChoiceField, so custom templates keep working.
+    return type(widget) is widgets.Select and hasattr(widget.choices, 'queryset')
+
+
+def _get_shared_select_context(shared_choices, widget, name, value, attrs):
+    # Each form has its own copy of the field and queryset, so compare the query instead.
+    field = widget.choices.field
+    queryset = widget.choices.queryset
+    try:
+        query = str(queryset.query)
+    except EmptyResultSet:
+        # The query of none() or pk__in=[] can't be printed, it returns no rows anyway.
+        return widget.get_context(name, value, attrs)
+
+    key = (type(field), field.empty_label, field.to_field_name, queryset.db, queryset.model, query)
+    try:
+        options = shared_choices[key]
+    except KeyError:
+        options = shared_choices[key] = SharedOptions(widget)
+
+    if options.html is None:
+        widget.choices = options.choices
+        return widget.get_context(name, value, attrs)
+
+    # Skip the optgroups() of the select widget.
+    context = widgets.Widget.get_context(widget, name, value, attrs)
+    context['widget']['template_name'] = 'any_urlfield/widgets/shared_select.html'
+    context['widget']['options_html'] = options.render(context['widget']['value'])
+    return context
+
+
+@contextmanager
+def shared_choices():
+    """
+    Share the choices of the :class:`AnyUrlWidget` select boxes within the ``with`` block.
+
+    The choices of each URL type are evaluated once, and each ``<option>`` is rendered once,
+    instead of for every form in a formset. The choices are not refreshed within the block.
+    """
+    token = _shared_choices.set({})
+    try:
+        yield
+    finally:
+        _shared_choices.reset(token)
+
+
+@context_middleware(shared_choices)
+def SharedChoicesMiddleware(get_response):
+    """
+    Share the choices of the :class:`AnyUrlWidget` select boxes within each request.
+    This supports both sync and async views.
+    """
+
 
 class SimpleRawIdWidget(ForeignKeyRawIdWidget):
     """
@@ -146,6 +312,9 @@ class SimpleRawIdWidget(ForeignKeyRawIdWidget):
         widget = SimpleRawIdWidget(MyModel)
     """
 
+    #: The objects to render, by their ID as string. Assigned by :func:`~any_urlfield.forms.prefetch_raw_id_objects`.
+    prefetched_objects = None
+
     def __init__(self, model, limit_choices_to=None, admin_site=None, attrs=None, using=None):
         """
         Instantiate the class.
@@ -159,23 +328,133 @@ class SimpleRawIdWidget(ForeignKeyRawIdWidget):
         """Optimize retrieval of the data.
         Because AnyUrlField.decompose() secretly returns both the ID,
         and it's prefetched object, there is no need to refetch the object here.
+        The same happens for the objects that :func:`~any_urlfield.forms.prefetch_raw_id_objects` assigned.
         """
         try:
             obj = value.prefetched_object  # ResolvedTypeValue
         except AttributeError:
-            return super().label_and_url_for_value(value)
+            if self.prefetched_objects is None:
+                return super().label_and_url_for_value(value)
+            obj = self.prefetched_objects.get(str(value))
+            if obj is None:
+                return '', ''  # Same as Django does for objects that don't exist.
+
+        return Truncator(obj).words(14, truncate='...'), get_admin_change_url(self.admin_site, obj)
+
+
+def get_admin_change_url(admin_site, obj):
+    """
+    Return the admin URL to change the object, or an empty string when the model is not registered.
+    The URL pattern is reversed only once per model.
+    """
+    url_format = _get_change_url_format(
+        admin_site.name, obj._meta.app_label, obj._meta.model_name, get_urlconf(), get_script_prefix()
+    )
+    if not url_format:
+        return ''
+    return url_format.replace(_PK_PLACEHOLDER, quote(str(obj.pk), safe=RFC3986_SUBDELIMS + "/~:@"))
+
+
+_PK_PLACEHOLDER = '__pk__'
+
+
+@lru_cache(maxsize=None)
+def _get_change_url_format(site_name, app_label, model_name, urlconf, script_prefix):
+    # The URLconf and script prefix are part of the cache key, as these change the reversed URL.
+    try:
+        return reverse(
+            '{admin}:{app}_{model}_change'.format(admin=site_name, app=app_label, model=model_name),
+            args=(_PK_PLACEHOLDER,)
+        )
+    except NoReverseMatch:
+        return ''  # Admin not registered for target model.
+
+
+@receiver(setting_changed)
+def _clear_change_url_format(setting, **kwargs):
+    # The reversed URLs change with these settings, e.g. in override_settings().
+    # Otherwise an empty URL that was cached before the admin URLs were loaded would stay.
+    if setting in ('ROOT_URLCONF', 'FORCE_SCRIPT_NAME', 'INSTALLED_APPS'):
+        _get_change_url_format.cache_clear()
+
+
+class SearchSelectWidget(widgets.Select):
+    """
+    A select box that searches the objects of the URL type, instead of listing all of them.
 
-        # Standard Django logic follows:
+    Use this for URL types with many objects, where the standard ``<select>`` would become too large:
+
+    .. code-block:: python
+
+        AnyUrlField.register_model(Product, widget=SearchSelectWidget(search_fields=('^sku', 'name')))
+
+    Only the selected object is rendered, other objects are fetched page by page from
+    the ``any_urlfield.views.search`` view, which needs to be included in the URLconf.
+    The ``search_fields`` follow the syntax of ``ModelAdmin.search_fields``;
+    use the ``^`` (starts with) and ``=`` (exact match) prefixes so database indexes can be used.
+    """
+    class Media:
+        js = (
+            'admin/js/vendor/jquery/jquery.min.js',
+            'admin/js/vendor/select2/select2.full.min.js',
+            'admin/js/jquery.init.js',
+            'any_urlfield/any_urlfield_search.js',
+        )
+        css = {'all': ('admin/css/vendor/select2/select2.min.css', 'admin/css/autocomplete.css')}
+
+    def __init__(self, search_fields=(), page_size=20, attrs=None):
+        if not search_fields:
+            raise ImproperlyConfigured("SearchSelectWidget requires search_fields.")
+
+        super().__init__(attrs=attrs)
+        self.search_fields = tuple(search_fields)
+        self.page_size = page_size
+
+    def get_url(self):
+        """
+        Return the URL of the search view.
+        """
+        opts = self.choices.queryset.model._meta
         try:
-            url = reverse(
-                '{admin}:{app}_{model}_change'.format(
-                    admin=self.admin_site.name,
-                    app=obj._meta.app_label,
-                    model=obj._meta.object_name.lower()
-                ),
-                args=(obj.pk,)
-            )
+            return reverse('any_urlfield:search', args=(opts.app_label, opts.model_name))
         except NoReverseMatch:
-            url = ''  # Admin not registered for target model.
+            raise ImproperlyConfigured(
+                "The SearchSelectWidget of '{}' requires 'any_urlfield.urls' in the URLconf.".format(opts.label)
+            )
+
+    def build_attrs(self, base_attrs, extra_attrs=None):
+        attrs = super().build_attrs(base_attrs, extra_attrs=extra_attrs)
+        attrs['class'] = '{} any_urlfield-search'.format(attrs.get('class', '')).strip()
+        attrs['data-ajax--url'] = self.get_url()
+        attrs['data-allow-clear'] = 'true'
+        attrs['data-placeholder'] = ''  # required by allowClear
+        attrs.setdefault('data-theme', 'admin-autocomplete')
+        return attrs
+
+    def get_context(self, name, value, attrs):
+        # The ResolvedTypeValue of AnyUrlWidget.decompress() already holds the selected object.
+        obj = getattr(value, 'prefetched_object', None)
+        context = super().get_context(name, value, attrs)
+        context['widget']['optgroups'] = self._get_optgroups(name, context['widget']['value'], obj)
+        return context
+
+    def optgroups(self, name, value, attrs=None):
+        # Avoid evaluating all choices, the selected object is rendered by get_context().
+        return []
+
+    def _get_optgroups(self, name, value, obj):
+        field = self.choices.field
+        options = []
+        if field.empty_label is not None:
+            options.append(self.create_option(name, '', field.empty_label, False, 0))
+
+        selected = [v for v in value if v]
+        if selected:
+            if obj is not None and str(obj.pk) == selected[0]:
+                objects = [obj]
+            else:
+                objects = self.choices.queryset.filter(pk__in=selected[:1])
+            for obj in objects:
+                options.append(self.create_option(name, str(obj.pk), field.label_from_instance(obj), True, len(options)))
 
-        return Truncator(obj).words(14, truncate='...'), url
+        return [(None, options, 0)]
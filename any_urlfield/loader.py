@@ -0,0 +1,187 @@
+"""
+Request scoped loading of URLs in batches.
+
+Code that can't collect all values up front (e.g. nested template includes or GraphQL resolvers)
+calls :func:`AnyUrlValue.load_url() <any_urlfield.models.AnyUrlValue.load_url>` instead of ``str(value)``.
+The values are queued, and rendered together when the first URL is needed:
+
+.. code-block:: python
+
+    with url_loader():
+        urls = [link.url.load_url() for link in links]
+        print(urls[0])  # renders all queued URLs at once
+
+In a view, the :func:`UrlLoaderMiddleware` installs a loader for every request.
+"""
+import asyncio
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.utils import translation
+from django.utils.translation import get_language
+
+from any_urlfield.middleware import context_middleware
+from any_urlfield.models.values import AnyUrlValue
+
+_current_loader = ContextVar('any_urlfield_url_loader', default=None)
+
+
+class UrlLoader:
+    """
+    Collects the values that need their URL, and renders them in bulk.
+
+    Rendering uses :func:`AnyUrlValue.render_urls() <any_urlfield.models.AnyUrlValue.render_urls>`,
+    so all queued values are read with a single cache call and one query per model.
+    The URLs are remembered for the lifetime of the loader,
+    so the same object is only rendered once per request.
+    """
+
+    def __init__(self):
+        self._pending = []  # (language_code, value)
+        self._urls = {}  # (id(url_type), type_value, language_code) -> url
+        self._flushing = set()  # async flushes in progress
+
+    def load(self, value):
+        """
+        Queue a value, and return a :class:`LazyUrl` that renders the URL on first use.
+        """
+        language_code = get_language()
+        if value.url_type.has_id_value and value.type_value and not _has_url(value, language_code):
+            url = self._urls.get(_get_key(value, language_code))
+            if url is not None:
+                value._set_url_cache(language_code, url)
+            else:
+                self._pending.append((language_code, value))
+        return LazyUrl(self, value, language_code)
+
+    def flush(self):
+        """
+        Render the URLs of all queued values.
+        """
+        for language_code, values_by_key in self._get_pending():
+            with translation.override(language_code):
+                unique_values = [values[0] for values in values_by_key.values()]
+                AnyUrlValue.render_urls(unique_values)
+            self._store_urls(language_code, values_by_key)
+
+    async def aflush(self):
+        """
+        Async version of :func:`flush`.
+        This also waits for the flushes that other tasks started, as these may render the caller's values.
+        """
+        pending = self._get_pending()
+        if pending:
+            task = asyncio.ensure_future(self._arender(pending))
+            self._flushing.add(task)
+            task.add_done_callback(self._flushing.discard)
+        if self._flushing:
+            await asyncio.gather(*self._flushing)
+
+    async def _arender(self, pending):
+        for language_code, values_by_key in pending:
+            with translation.override(language_code):
+                unique_values = [values[0] for values in values_by_key.values()]
+                await AnyUrlValue.arender_urls(unique_values)
+            self._store_urls(language_code, values_by_key)
+
+    def _get_pending(self):
+        pending, self._pending = self._pending, []
+        by_language = {}  # language_code -> {key: [values]}
+        for language_code, value in pending:
+            if not _has_url(value, language_code):
+                by_language.setdefault(language_code, {}).setdefault(_get_key(value, language_code), []).append(value)
+        return list(by_language.items())
+
+    def _store_urls(self, language_code, values_by_key):
+        for key, values in values_by_key.items():
+            url = values[0]._url_cache[language_code]
+            self._urls[key] = url
+            for value in values[1:]:
+                value._set_url_cache(language_code, url)
+
+
+class LazyUrl:
+    """
+    The URL of a value that is queued in a :class:`UrlLoader`.
+
+    Converting it to a string renders all queued URLs.
+    In async code, ``await`` it instead, which lets other tasks queue their values first.
+    """
+    __slots__ = ('loader', 'value', 'language_code')
+
+    def __init__(self, loader, value, language_code):
+        self.loader = loader
+        self.value = value
+        self.language_code = language_code
+
+    def __str__(self):
+        if not _has_url(self.value, self.language_code):
+            self.loader.flush()
+        return self._get_url()
+
+    def __await__(self):
+        return self._aget().__await__()
+
+    async def _aget(self):
+        if not _has_url(self.value, self.language_code):
+            # Like a DataLoader, give the other tasks a chance to queue their values.
+            await asyncio.sleep(0)
+            if not _has_url(self.value, self.language_code):
+                await self.loader.aflush()
+
+        if not _has_url(self.value, self.language_code):
+            # External URLs, or values that were changed after they were queued.
+            with translation.override(self.language_code):
+                return await self.value.aurl()
+        return self.value._url_cache[self.language_code]
+
+    def _get_url(self):
+        try:
+            return self.value._url_cache[self.language_code]
+        except (TypeError, KeyError):
+            with translation.override(self.language_code):
+                return str(self.value)
+
+    def __repr__(self):
+        return '<LazyUrl {!r}>'.format(self.value)
+
+
+def _get_key(value, language_code):
+    # Not using the value itself, as URL types of different registries may use the same prefix.
+    return (id(value.url_type), value.type_value, language_code)
+
+
+def _has_url(value, language_code):
+    return value._url_cache is not None and language_code in value._url_cache
+
+
+def get_url_loader():
+    """
+    Return the active :class:`UrlLoader`.
+    When no loader is installed, a new loader is returned that only serves the caller.
+    """
+    loader = _current_loader.get()
+    if loader is None:
+        loader = UrlLoader()
+    return loader
+
+
+@contextmanager
+def url_loader():
+    """
+    Install a :class:`UrlLoader` for the code within the ``with`` block.
+    """
+    loader = UrlLoader()
+    token = _current_loader.set(loader)
+    try:
+        yield loader
+    finally:
+        _current_loader.reset(token)
+
+
+@context_middleware(url_loader)
+def UrlLoaderMiddleware(get_response):
+    """
+    Install a :class:`UrlLoader` for each request.
+    This supports both sync and async views.
+    """
@@ -0,0 +1,32 @@
+"""
+Helpers for the middleware of this package.
+"""
+import asyncio
+from functools import wraps
+
+
+def context_middleware(context_manager):
+    """
+    Turn the decorated function into a middleware factory, which handles each request within ``context_manager()``.
+    The middleware supports both sync and async views; the decorated function only provides the name and docstring.
+    """
+    def decorator(func):
+        @wraps(func)
+        def middleware_factory(get_response):
+            if asyncio.iscoroutinefunction(get_response):
+                async def middleware(request):
+                    with context_manager():
+                        return await get_response(request)
+            else:
+                def middleware(request):
+                    with context_manager():
+                        return get_response(request)
+
+            return middleware
+
+        # Same as Django's @sync_and_async_middleware, which doesn't exist in Django 2.2.
+        middleware_factory.sync_capable = True
+        middleware_factory.async_capable = True
+        return middleware_factory
+
+    return decorator
@@ -1,6 +1,8 @@
 from .fields import AnyUrlField
+from .query import AnyUrlManager, AnyUrlQuerySet, AnyUrlQuerySetMixin
 from .values import AnyUrlValue
 
 __all__ = (
-    'AnyUrlField', 'AnyUrlValue'
+    'AnyUrlField', 'AnyUrlValue',
+    'AnyUrlManager', 'AnyUrlQuerySet', 'AnyUrlQuerySetMixin',
 )
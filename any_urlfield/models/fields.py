@@ -2,11 +2,14 @@
 Custom model fields to link to CMS content.
 """
 from collections import defaultdict
+from functools import partial
 
 from django.core.exceptions import ValidationError
 from django.db import models
+from django.db.models.constants import LOOKUP_SEP
 
-from any_urlfield.models.values import AnyUrlValue
+from any_urlfield import appsettings
+from any_urlfield.models.values import AnyUrlValue, SiblingValues
 from any_urlfield.registry import UrlTypeRegistry
 from any_urlfield.validators import ExtendedURLValidator
 
@@ -46,16 +49,38 @@ class AnyUrlField(models.CharField):
         AnyUrlField.register_model(Article, widget=SimpleRawIdWidget(Article))
 
     Now, the ``Article`` model will be displayed as raw input field with a browse button.
+
+    When the field is often loaded but rarely read, use ``AnyUrlField(lazy=True)``
+    (or the ``ANY_URLFIELD_LAZY`` setting) to parse the database value only on first access.
+    Lazy fields return the raw database string in ``values()`` and ``values_list()`` queries;
+    use :func:`AnyUrlValue.from_db_value() <any_urlfield.models.AnyUrlValue.from_db_value>` to parse these.
+
+    To avoid a query per value when the URLs of a queryset are rendered, use ``AnyUrlField(auto_resolve=True)``
+    (or the ``ANY_URLFIELD_AUTO_RESOLVE`` setting). When a value needs its object,
+    all values loaded by the same query are resolved in bulk.
+    This doesn't apply to lazy fields, as these values are parsed individually.
     """
     _static_registry = UrlTypeRegistry()  # Also accessed by AnyUrlValue as internal field.
 
     def __init__(self, *args, **kwargs):
+        lazy = kwargs.pop('lazy', None)
+        auto_resolve = kwargs.pop('auto_resolve', None)
         if 'max_length' not in kwargs:
             kwargs['max_length'] = 300
         super().__init__(*args, **kwargs)
 
+        # Not part of deconstruct(), as these don't affect the database.
+        self.lazy = appsettings.ANY_URLFIELD_LAZY if lazy is None else lazy
+        self.auto_resolve = appsettings.ANY_URLFIELD_AUTO_RESOLVE if auto_resolve is None else auto_resolve
+
+    def contribute_to_class(self, cls, name, *args, **kwargs):
+        super().contribute_to_class(cls, name, *args, **kwargs)
+        if self.lazy:
+            setattr(cls, self.attname, LazyAnyUrlDescriptor(self))
+
     @classmethod
-    def register_model(cls, ModelClass, form_field=None, widget=None, title=None, prefix=None):
+    def register_model(cls, ModelClass, form_field=None, widget=None, title=None, prefix=None,
+                       cache_timeout=None, cache_alias=None, cache_urls=True, url_dependents=None):
         """
         Register a model to use in the URL field.
 
@@ -67,8 +92,16 @@ class AnyUrlField(models.CharField):
         :param widget: The widget class, can be used instead of the form field.
         :param title: The title of the model, by default it uses the models ``verbose_name``.
         :param prefix: A custom prefix for the model in the serialized database format. By default it uses "appname.modelname".
+        :param cache_timeout: How long the URLs are cached, by default the ``ANY_URLFIELD_CACHE_TIMEOUT`` setting.
+        :param cache_alias: The cache to store the URLs in, by default the ``ANY_URLFIELD_CACHE_ALIAS`` setting.
+        :param cache_urls: Whether the URLs are cached at all.
+        :param url_dependents: A function that returns the objects whose URL depends on the saved object,
+            e.g. ``lambda page: page.get_descendants()``. Their cached URLs are invalidated as well.
         """
-        cls._static_registry.register(ModelClass, form_field, widget, title, prefix)
+        cls._static_registry.register(
+            ModelClass, form_field, widget, title, prefix,
+            cache_timeout=cache_timeout, cache_alias=cache_alias, cache_urls=cache_urls, url_dependents=url_dependents
+        )
 
     def formfield(self, **kwargs):
         # Associate formfield.
@@ -84,10 +117,20 @@ class AnyUrlField(models.CharField):
         # The "context" parameter is removed in Django 3.0, hence made optional here
         # This method is used to cast DB values to python values.
         # The call to to_python() is not used anymore.
-        if value is None:
-            return None
+        if value is None or self.lazy:
+            return value  # LazyAnyUrlDescriptor parses it on access.
         return AnyUrlValue.from_db_value(value, self._static_registry)
 
+    def get_db_converters(self, connection):
+        # This is called once for every query execution,
+        # which makes it possible to relate the values of the same query.
+        if self.auto_resolve and not self.lazy:
+            return [partial(self._from_db_value_siblings, SiblingValues())]
+        return super().get_db_converters(connection)
+
+    def _from_db_value_siblings(self, siblings, value, expression, connection, context=None):
+        return siblings.add(self.from_db_value(value, expression, connection))
+
     def to_python(self, value):
         if isinstance(value, AnyUrlValue):
             return value
@@ -111,17 +154,25 @@ class AnyUrlField(models.CharField):
     def pre_save(self, model_instance, add):
         # Make sure that the SQL compiler in doesn't get an AnyUrlValue,
         # but a regular 'str' object it can write to the database.
-        value = super().pre_save(model_instance, add)
+        value = self._get_raw_value(model_instance)
         if not value:
             return None
+        elif isinstance(value, str):
+            return value  # Unparsed lazy value
         else:
             return value.to_db_value()
 
     def value_to_string(self, obj):
         # For dumpdata and serialization
-        value = self.value_from_object(obj)
+        value = self._get_raw_value(obj)
         return self.get_prep_value(value)
 
+    def _get_raw_value(self, obj):
+        # Avoid parsing lazy values, when these are only written back.
+        if self.lazy and self.attname in obj.__dict__:
+            return obj.__dict__[self.attname]
+        return self.value_from_object(obj)
+
     def validate(self, value, model_instance):
         # Final validation of the field, before storing in the DB.
         super().validate(value, model_instance)
@@ -131,32 +182,109 @@ class AnyUrlField(models.CharField):
                 validate_url(value.type_value)
             elif value.type_value:
                 if not value.exists():
-                    raise ValidationError(self.error_messages['invalid_choice'] % value.type_value)
+                    raise ValidationError(
+                        self.error_messages['invalid_choice'], code='invalid_choice', params={'value': value.type_value}
+                    )
+
+    @classmethod
+    def validate_many(cls, values):
+        """
+        Check whether the objects of many values exist, using a single query per model.
+
+        The objects are stored in the values, so the ``exists()`` check
+        in the field validation (e.g. by ``full_clean()``) doesn't perform a query afterwards.
+
+        Forms don't need this when the form field of the URL type is a ``ModelChoiceField`` (the default),
+        as that already fetches the selected object, one query per form. Form fields that return
+        the ID instead (e.g. a custom raw ID field) leave a query per row to the model validation,
+        call this method with the values of all forms first to avoid that.
+        Note that :func:`~any_urlfield.forms.prefetch_raw_id_objects` only avoids the queries to render the widgets.
+
+        :param values: The :class:`~any_urlfield.models.AnyUrlValue` objects to check, may include ``None``.
+        :returns: The values that refer to an object that doesn't exist.
+        """
+        values = [value for value in values if value and value.url_type.has_id_value]
+        AnyUrlValue.resolve_values(values)
+        return [value for value in values if not value.exists()]
 
     @classmethod
-    def resolve_objects(cls, objects, skip_cached_urls=False):
+    def resolve_objects(cls, objects, skip_cached_urls=False, fields=None):
         """
         Make sure all AnyUrlValue objects from a set of objects is resolved in bulk.
         This avoids making a query per item.
 
         :param objects: A list or queryset of models.
         :param skip_cached_urls: Whether to avoid prefetching data that has it's URL cached.
+        :param fields: The field names to resolve, by default all ``AnyUrlField`` fields of the models.
+            Fields of related objects can be given as ``relation__field``.
         """
         # Allow the queryset or list to consist of multiple models.
         # This supports querysets from django-polymorphic too.
         queryset = list(objects)
         any_url_values = []
 
-        for obj in queryset:
-            model = obj.__class__
-            for field in _any_url_fields_by_model[model]:
-                any_url_value = getattr(obj, field)
-                if any_url_value and any_url_value.url_type.has_id_value:
-                    any_url_values.append(any_url_value)
+        if fields is None:
+            for obj in queryset:
+                model = obj.__class__
+                for field in _any_url_fields_by_model[model]:
+                    any_url_values.append(getattr(obj, field))
+        else:
+            for field in fields:
+                any_url_values.extend(_get_related_values(queryset, field.split(LOOKUP_SEP)))
 
+        any_url_values = [
+            any_url_value for any_url_value in any_url_values
+            if any_url_value and any_url_value.url_type.has_id_value
+        ]
         AnyUrlValue.resolve_values(any_url_values, skip_cached_urls=skip_cached_urls)
 
 
+def _get_related_values(objects, path):
+    # Follow the relations, this uses the prefetch_related() cache when it's available.
+    for name in path[:-1]:
+        related_objects = []
+        for obj in objects:
+            related = getattr(obj, name, None)
+            if related is None:
+                continue
+            elif hasattr(related, 'all'):
+                related_objects.extend(related.all())  # Reverse or many-to-many relation
+            else:
+                related_objects.append(related)
+        objects = related_objects
+
+    return [getattr(obj, path[-1]) for obj in objects]
+
+
+class LazyAnyUrlDescriptor:
+    """
+    Descriptor for lazy fields.
+    The model instance holds the raw database value, until the attribute is read.
+    """
+
+    def __init__(self, field):
+        self.field = field
+
+    def __get__(self, instance, cls=None):
+        if instance is None:
+            return self
+
+        data = instance.__dict__
+        attname = self.field.attname
+        if attname not in data:
+            # Deferred field, let Django fetch it.
+            instance.refresh_from_db(fields=[attname])
+
+        value = data[attname]
+        if isinstance(value, str):
+            value = self.field.to_python(value)
+            data[attname] = value
+        return value
+
+    def __set__(self, instance, value):
+        instance.__dict__[self.field.attname] = value
+
+
 class _ModelFieldsCache(defaultdict):
     def __missing__(self, model):
         from .fields import AnyUrlField
@@ -0,0 +1,56 @@
+"""
+Queryset support to resolve the objects of ``AnyUrlField`` values in bulk.
+"""
+from django.db import models
+from django.db.models.query import ModelIterable
+
+
+class AnyUrlQuerySetMixin:
+    """
+    Mixin for custom querysets, adding the :func:`prefetch_anyurls` method.
+    """
+    _prefetch_anyurl_fields = None
+
+    def prefetch_anyurls(self, *fields, skip_cached_urls=False):
+        """
+        Resolve the objects of the ``AnyUrlField`` values in bulk when the queryset is evaluated.
+        This performs a single query per linked model, instead of a query per value.
+
+        Without arguments, all ``AnyUrlField`` fields of the model are resolved.
+        Fields of related objects can be given as ``relation__field``,
+        which is best combined with :meth:`~django.db.models.query.QuerySet.prefetch_related`.
+        Alternatively, use this queryset in a :class:`~django.db.models.Prefetch` object.
+        Passing ``None`` clears the setting.
+        """
+        clone = self._chain()
+        if fields == (None,):
+            clone._prefetch_anyurl_fields = None
+        else:
+            clone._prefetch_anyurl_fields = (fields or None, skip_cached_urls)
+        return clone
+
+    def _clone(self, *args, **kwargs):
+        clone = super()._clone(*args, **kwargs)
+        clone._prefetch_anyurl_fields = self._prefetch_anyurl_fields
+        return clone
+
+    def _fetch_all(self):
+        is_fetched = self._result_cache is not None
+        super()._fetch_all()
+        if not is_fetched and self._prefetch_anyurl_fields is not None \
+                and issubclass(self._iterable_class, ModelIterable):
+            from any_urlfield.models.fields import AnyUrlField
+            fields, skip_cached_urls = self._prefetch_anyurl_fields
+            AnyUrlField.resolve_objects(self._result_cache, skip_cached_urls=skip_cached_urls, fields=fields)
+
+
+class AnyUrlQuerySet(AnyUrlQuerySetMixin, models.QuerySet):
+    """
+    Queryset that supports :func:`~AnyUrlQuerySetMixin.prefetch_anyurls`.
+    """
+
+
+class AnyUrlManager(models.Manager.from_queryset(AnyUrlQuerySet)):
+    """
+    Manager that supports :func:`~AnyUrlQuerySetMixin.prefetch_anyurls`.
+    """
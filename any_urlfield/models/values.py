@@ -2,19 +2,26 @@
 Custom data objects
 """
 
+import asyncio
 import logging
+import threading
+import time
+from functools import partial
 
 from django.apps import apps
-from django.core.cache import cache
 from django.core.exceptions import ObjectDoesNotExist
+from django.utils.translation import get_language
 
-from any_urlfield.cache import get_urlfield_cache_key
+from any_urlfield import appsettings
+from any_urlfield.cache import get_url_cache, get_urlfield_cache_key, get_urlfield_cache_keys, single_flight
 
 
 logger = logging.getLogger('any_urlfield.models')
 
-# Not really sure about the cache invalidation yet
-URL_CACHE_TIMEOUT = 3600   # 1 hour
+NEGATIVE_CACHE_TIMEOUT = appsettings.ANY_URLFIELD_NEGATIVE_CACHE_TIMEOUT
+
+_missing_logged = {}  # cache_key -> time
+_missing_logged_lock = threading.Lock()
 
 
 class AnyUrlValue:
@@ -36,6 +43,8 @@ class AnyUrlValue:
 
         {{ mymodel.url }}
     """
+    # Avoid a __dict__ per instance, as many values are loaded at once.
+    __slots__ = ('url_type_registry', 'url_type', '_type_value', '_resolved_objects', '_url_cache', '_siblings')
 
     def __init__(self, type_prefix, type_value, url_type_registry=None):
         # Easy configuration, allowing other code to deserialize database values.
@@ -43,14 +52,15 @@ class AnyUrlValue:
             from any_urlfield.models.fields import AnyUrlField
             url_type_registry = AnyUrlField._static_registry
 
-        # Note when adding attributes, also add these to __setstate__()
+        # Note when adding attributes, also add these to __setstate__() and _from_url_type()
         self.url_type_registry = url_type_registry
         self.url_type = url_type_registry[type_prefix]
-        self.type_value = type_value
+        self._type_value = type_value
         self._resolved_objects = None
-        self._url_cache = {}
+        self._url_cache = None
+        self._siblings = None
 
-        if url_type_registry.index(type_prefix) is None:
+        if self.url_type is None:
             raise ValueError("Unsupported AnyUrlValue prefix '{}'. Supported values are: {}".format(type_prefix, url_type_registry.keys()))
 
     @classmethod
@@ -85,25 +95,24 @@ class AnyUrlValue:
             from any_urlfield.models.fields import AnyUrlField
             url_type_registry = AnyUrlField._static_registry
 
-        try:
-            prefix, url_rest = url.split('://', 2)
-        except ValueError:
-            # While expecting the field to be validated,
-            # Don't crash when there is old contents.
-            prefix = 'http'
-            url_rest = url
-
-        url_type = url_type_registry[prefix]
-        if url_type is None:
-            raise ValueError("Unsupported URL prefix in database value '{}'. Supported values are: {}".format(url, url_type_registry.keys()))
+        # The parsed data is shared by the registry cache,
+        # each call still receives a new value object that it can modify.
+        url_type, type_value = url_type_registry.parse_db_value(url)
+        if url_type.has_id_value and type_value is None:
+            return None
+        return cls._from_url_type(url_type, type_value, url_type_registry)
 
-        if url_type.has_id_value:
-            if url_rest == 'None':
-                return None
-            id = int(url_rest)
-            return AnyUrlValue(prefix, id, url_type_registry)
-        else:
-            return AnyUrlValue(prefix, url, url_type_registry)
+    @classmethod
+    def _from_url_type(cls, url_type, type_value, url_type_registry):
+        # Fast path that skips the prefix lookup and check of __init__()
+        value = cls.__new__(cls)
+        value.url_type_registry = url_type_registry
+        value.url_type = url_type
+        value._type_value = type_value
+        value._resolved_objects = None
+        value._url_cache = None
+        value._siblings = None
+        return value
 
     def to_db_value(self):
         """
@@ -124,6 +133,9 @@ class AnyUrlValue:
         if self.url_type.prefix == 'http' and self.type_value:
             return True
         elif self.url_type.has_id_value:
+            if self._resolved_objects is None and self._siblings is not None:
+                self._siblings.resolve()
+
             if self._resolved_objects is not None:
                 # Test whether the in_bulk() found the object
                 return self.type_value in self._resolved_objects
@@ -153,6 +165,10 @@ class AnyUrlValue:
         """
         if self.url_type.has_id_value:
             Model = self.get_model()
+            if self._resolved_objects is None and self._siblings is not None:
+                # Resolve all values of the same query at once.
+                self._siblings.resolve()
+
             if self._resolved_objects is not None:
                 try:
                     return self._resolved_objects[self.type_value]
@@ -164,11 +180,61 @@ class AnyUrlValue:
                     )
             else:
                 object = Model.objects.get(pk=self.type_value)
-                self._resolved_objects = {self.type_value: object}
+                self._set_resolved_objects({self.type_value: object})
                 return object
         else:
             return None
 
+    async def aget_object(self):
+        """
+        Async version of :func:`get_object`.
+        """
+        if self.url_type.has_id_value:
+            if self._resolved_objects is None:
+                if self._siblings is not None:
+                    await self._siblings.aresolve()
+                else:
+                    object = await _aget(self.get_model(), self.type_value)
+                    self._set_resolved_objects({self.type_value: object})
+            return self.get_object()
+        else:
+            return None
+
+    async def aurl(self):
+        """
+        Async version of ``str(value)``, which returns the URL that the value points to.
+
+        The object's ``get_absolute_url()`` is called in the async context,
+        so it should not perform database queries.
+        """
+        if self.url_type.has_id_value and self.type_value:
+            return (await self.arender_urls([self]))[0]
+        return str(self)
+
+    def load_url(self):
+        """
+        Queue the value in the request scoped :class:`~any_urlfield.loader.UrlLoader`,
+        and return a :class:`~any_urlfield.loader.LazyUrl`.
+
+        All queued values are rendered in bulk when the first URL is converted to a string, or awaited.
+        """
+        from any_urlfield.loader import get_url_loader
+        return get_url_loader().load(self)
+
+    @property
+    def type_value(self):
+        """
+        The ID of the object, or the external URL.
+        """
+        return self._type_value
+
+    @type_value.setter
+    def type_value(self, type_value):
+        self._type_value = type_value
+        # Forget everything that was derived from the previous value.
+        self._resolved_objects = None
+        self._url_cache = None
+
     @property
     def type_prefix(self):
         """
@@ -191,29 +257,57 @@ class AnyUrlValue:
     def __str__(self):
         """
         Return the URL that the value points to.
+
+        The URL is remembered per language, so repeated calls
+        (e.g. by ``len()`` or template filters) don't read the cache again.
         """
-        if self.url_type.has_id_value:
+        url_type = self.url_type
+        if url_type.has_id_value:
             if not self.type_value:
                 return ""
 
-            # First see if the URL is cached
-            cache_key = get_urlfield_cache_key(self.get_model(), self.type_value)
-            url = cache.get(cache_key)
-            if url:
-                return url
-
-            try:
-                object = self.get_object()
-                url = object.get_absolute_url()
-                cache.set(cache_key, url, URL_CACHE_TIMEOUT)
-                return url
-            except ObjectDoesNotExist as e:
-                # Silently fail in templates. Avoid full page crashing.
-                logger.error("Failed to generate URL for %r: %s", self, e)
-                return "#{}".format(e.__class__.__name__)
+            # See if the URL was already generated for this value.
+            language_code = get_language()
+            if self._url_cache is not None:
+                try:
+                    return self._url_cache[language_code]
+                except KeyError:
+                    pass
+
+            if not url_type.cache_urls:
+                url = self._generate_url(None)
+            else:
+                # First see if the URL is cached
+                cache_key = get_urlfield_cache_key(self.get_model(), self.type_value, language_code, url_type.cache_alias)
+                url = get_url_cache(url_type.cache_alias).get(cache_key)
+                if not url:
+                    if appsettings.ANY_URLFIELD_CACHE_SINGLE_FLIGHT:
+                        # Avoid that all workers generate a popular URL at the same time.
+                        url = single_flight(cache_key, partial(self._generate_url, cache_key), url_type.cache_alias)
+                    else:
+                        url = self._generate_url(cache_key)
+
+            self._set_url_cache(language_code, url)
+            return url
         else:
             return self.type_value or ""
 
+    def _generate_url(self, cache_key):
+        # The cache_key is None when the URL type doesn't cache its URLs.
+        try:
+            object = self.get_object()
+            url = object.get_absolute_url()
+            timeout = self.url_type.get_cache_timeout()
+        except ObjectDoesNotExist as e:
+            # Silently fail in templates. Avoid full page crashing.
+            # The result is cached shortly, so stale links don't query each time.
+            url = _get_missing_url(self, cache_key, e)
+            timeout = NEGATIVE_CACHE_TIMEOUT
+
+        if cache_key is not None and timeout:
+            get_url_cache(self.url_type.cache_alias).set(cache_key, url, timeout)
+        return url
+
     def __len__(self):
         return len(str(self))
 
@@ -245,6 +339,10 @@ class AnyUrlValue:
     def __ne__(self, other):
         return not self == other
 
+    def __hash__(self):
+        # Equal URL types share the same prefix.
+        return hash((self.url_type.prefix, self.type_value))
+
     def __getstate__(self):
         """
         Pickle support
@@ -267,32 +365,274 @@ class AnyUrlValue:
         else:
             self.url_type_registry = AnyUrlField._static_registry
 
-        self.type_value = type_value
+        self._type_value = type_value
         self.url_type = self.url_type_registry[prefix]
         self._resolved_objects = None
-        self._url_cache = {}
+        self._url_cache = None
+        self._siblings = None
 
     @classmethod
     def resolve_values(cls, values, skip_cached_urls=False):
         """
         Resolve the models for collection of AnyUrlValue objects, to avoid a query per object.
+
+        With ``skip_cached_urls=True``, the URLs are rendered using :func:`render_urls` instead,
+        so values that have their URL cached don't need to fetch their object.
         """
-        ids_to_resolve = {}
-        values_by_model = {}
-        for value in values:
-            if value and value.url_type.has_id_value and value._resolved_objects is None:
-                Model = value.url_type.model
-                if skip_cached_urls and cache.get(get_urlfield_cache_key(Model, value.type_value)):
-                    continue
+        if skip_cached_urls:
+            cls.render_urls(values)
+        else:
+            cls._resolve_objects(values)
+
+    @classmethod
+    async def aresolve_values(cls, values, skip_cached_urls=False):
+        """
+        Async version of :func:`resolve_values`.
+        The objects of different models are fetched concurrently.
+        """
+        if skip_cached_urls:
+            await cls.arender_urls(values)
+        else:
+            await cls._aresolve_objects(values)
+
+    @classmethod
+    def render_urls(cls, values):
+        """
+        Generate the URLs for a collection of AnyUrlValue objects in bulk.
 
-                ids_to_resolve.setdefault(Model, set()).add(value.type_value)
-                values_by_model.setdefault(Model, []).append(value)
+        This reads the cache once for all values, fetches the missing objects
+        with a single query per model, and writes all new URLs to the cache at once.
+        The URLs are stored in each value, so calling ``str()`` on it afterwards is free.
 
+        :returns: The URLs, in the same order as the values.
+        """
+        language_code = get_language()
+        value_keys, missing = _get_url_cache_keys(values, language_code)
+
+        # A single cache read per cache alias.
+        for cache_alias, alias_value_keys in value_keys.items():
+            cached_urls = get_url_cache(cache_alias).get_many({cache_key for value, cache_key in alias_value_keys})
+            missing.extend(_set_cached_urls(alias_value_keys, cached_urls, language_code))
+
+        if missing:
+            cls._resolve_objects([value for value, cache_key in missing])
+            new_urls = _generate_urls(missing, language_code)
+            for (cache_alias, timeout), urls in new_urls.items():
+                get_url_cache(cache_alias).set_many(urls, timeout)
+
+        return [str(value) if value is not None else "" for value in values]
+
+    @classmethod
+    async def arender_urls(cls, values):
+        """
+        Async version of :func:`render_urls`.
+        The cache aliases and models are accessed concurrently.
+        """
+        language_code = get_language()
+        if appsettings.ANY_URLFIELD_CACHE_INVALIDATION == 'generation':
+            # The cache keys include the generation, which is read from the cache.
+            from asgiref.sync import sync_to_async
+            value_keys, missing = await sync_to_async(_get_url_cache_keys)(values, language_code)
+        else:
+            value_keys, missing = _get_url_cache_keys(values, language_code)
+
+        cache_aliases = list(value_keys)
+        all_cached_urls = await asyncio.gather(*(
+            get_url_cache(cache_alias).aget_many({cache_key for value, cache_key in value_keys[cache_alias]})
+            for cache_alias in cache_aliases
+        ))
+        for cache_alias, cached_urls in zip(cache_aliases, all_cached_urls):
+            missing.extend(_set_cached_urls(value_keys[cache_alias], cached_urls, language_code))
+
+        if missing:
+            await cls._aresolve_objects([value for value, cache_key in missing])
+            new_urls = _generate_urls(missing, language_code)
+            await asyncio.gather(*(
+                get_url_cache(cache_alias).aset_many(urls, timeout)
+                for (cache_alias, timeout), urls in new_urls.items()
+            ))
+
+        # All URLs are stored in the values now, so str() doesn't access the cache.
+        return [str(value) if value is not None else "" for value in values]
+
+    @classmethod
+    def _resolve_objects(cls, values):
+        ids_to_resolve, values_by_model = _get_ids_to_resolve(values)
         for Model, ids in ids_to_resolve.items():
             # When an object can't be found, it simply won't be found in the _resolved_objects dict.
             resolved_objects = Model.objects.in_bulk(ids)
             for value in values_by_model[Model]:
-                value._resolved_objects = resolved_objects
+                value._set_resolved_objects(resolved_objects)
+
+    @classmethod
+    async def _aresolve_objects(cls, values):
+        ids_to_resolve, values_by_model = _get_ids_to_resolve(values)
+        models = list(ids_to_resolve)
+        all_resolved_objects = await asyncio.gather(*(_ain_bulk(Model, ids_to_resolve[Model]) for Model in models))
+        for Model, resolved_objects in zip(models, all_resolved_objects):
+            for value in values_by_model[Model]:
+                value._set_resolved_objects(resolved_objects)
+
+    def _set_resolved_objects(self, resolved_objects):
+        self._resolved_objects = resolved_objects
+        self._url_cache = None  # URL may be generated from a different object now.
+
+    def _set_url_cache(self, language_code, url):
+        if self._url_cache is None:
+            self._url_cache = {}
+        self._url_cache[language_code] = url
+
+
+def _get_url_cache_keys(values, language_code):
+    """
+    Return the cache keys of the values that have no URL yet, grouped per cache alias.
+    The values of URL types that don't cache their URLs are returned as missing.
+    """
+    values_by_type = {}  # id(url_type) -> (url_type, values), as URL types are compared by model only.
+    for value in values:
+        if value and value.url_type.has_id_value \
+                and (value._url_cache is None or language_code not in value._url_cache):
+            values_by_type.setdefault(id(value.url_type), (value.url_type, []))[1].append(value)
+
+    # Not using a dict here, as equal values from different objects all need their URL.
+    value_keys = {}  # cache alias -> [(value, cache_key)]
+    missing = []
+    for url_type, type_values in values_by_type.values():
+        if not url_type.cache_urls:
+            missing.extend((value, None) for value in type_values)
+            continue
+
+        cache_keys = get_urlfield_cache_keys(
+            type_values[0].get_model(), [value.type_value for value in type_values], language_code, url_type.cache_alias
+        )
+        value_keys.setdefault(url_type.cache_alias, []).extend(zip(type_values, cache_keys))
+    return value_keys, missing
+
+
+def _set_cached_urls(value_keys, cached_urls, language_code):
+    """
+    Store the cached URLs in the values, and return the ``(value, cache_key)`` pairs that were not cached.
+    """
+    missing = []
+    for value, cache_key in value_keys:
+        url = cached_urls.get(cache_key)
+        if url:
+            value._set_url_cache(language_code, url)
+        else:
+            missing.append((value, cache_key))
+    return missing
+
+
+def _generate_urls(missing, language_code):
+    """
+    Generate the URLs of resolved values, and return the URLs to cache.
+    """
+    new_urls = {}  # (cache alias, timeout) -> {cache_key: url}
+    for value, cache_key in missing:
+        try:
+            url = value.get_object().get_absolute_url()
+            timeout = value.url_type.get_cache_timeout()
+        except ObjectDoesNotExist as e:
+            url = _get_missing_url(value, cache_key, e)
+            timeout = NEGATIVE_CACHE_TIMEOUT
+
+        if cache_key is not None and timeout:
+            new_urls.setdefault((value.url_type.cache_alias, timeout), {})[cache_key] = url
+        value._set_url_cache(language_code, url)
+    return new_urls
+
+
+def _get_ids_to_resolve(values):
+    ids_to_resolve = {}
+    values_by_model = {}
+    for value in values:
+        if value and value.url_type.has_id_value and value._resolved_objects is None:
+            Model = value.get_model()
+            ids_to_resolve.setdefault(Model, set()).add(value.type_value)
+            values_by_model.setdefault(Model, []).append(value)
+    return ids_to_resolve, values_by_model
+
+
+async def _ain_bulk(Model, ids):
+    try:
+        ain_bulk = Model.objects.ain_bulk
+    except AttributeError:
+        # Django < 4.1 has no async ORM API.
+        from asgiref.sync import sync_to_async
+        return await sync_to_async(Model.objects.in_bulk)(ids)
+    return await ain_bulk(ids)
+
+
+async def _aget(Model, pk):
+    try:
+        aget = Model.objects.aget
+    except AttributeError:
+        from asgiref.sync import sync_to_async
+        return await sync_to_async(Model.objects.get)(pk=pk)
+    return await aget(pk=pk)
+
+
+def _get_missing_url(value, cache_key, exception):
+    """
+    Return the URL for an object that doesn't exist, and log the error.
+    The error is only logged once per timeout, as pages with a stale link are rendered often.
+    """
+    if cache_key is None:
+        cache_key = value.to_db_value()  # URL type without caching.
+
+    now = time.monotonic()
+    with _missing_logged_lock:
+        last_logged = _missing_logged.get(cache_key)
+        log_error = last_logged is None or now - last_logged >= (NEGATIVE_CACHE_TIMEOUT or 60)
+        if log_error:
+            if len(_missing_logged) >= 1000:
+                _missing_logged.clear()
+            _missing_logged[cache_key] = now
+
+    if log_error:
+        logger.error("Failed to generate URL for %r: %s", value, exception)
+    else:
+        logger.debug("Failed to generate URL for %r: %s", value, exception)
+
+    return "#{}".format(exception.__class__.__name__)
+
+
+class SiblingValues:
+    """
+    The values loaded by a single query, used by ``AnyUrlField(auto_resolve=True)``.
+    When one of the values needs its object, all values are resolved in bulk.
+    """
+    __slots__ = ('values',)
+
+    def __init__(self):
+        self.values = []
+
+    def add(self, value):
+        """
+        Add a value, when it can be resolved.
+        """
+        if value is not None and value.url_type.has_id_value:
+            value._siblings = self
+            self.values.append(value)
+        return value
+
+    def resolve(self):
+        """
+        Resolve all values that are not resolved yet.
+        """
+        values, self.values = self.values, []
+        AnyUrlValue.resolve_values(values)
+        for value in values:
+            value._siblings = None
+
+    async def aresolve(self):
+        """
+        Async version of :func:`resolve`.
+        """
+        values, self.values = self.values, []
+        await AnyUrlValue.aresolve_values(values)
+        for value in values:
+            value._siblings = None
 
 
 class ResolvedTypeValue:
@@ -301,6 +641,7 @@ class ResolvedTypeValue:
     This allows code to pass ``AnyUrlField.bound_type_value``
     while the widget rendering still reduces the prefetched object.
     """
+    __slots__ = ('value', 'prefetched_object')
 
     def __init__(self, value, prefetched_object):
         self.value = value
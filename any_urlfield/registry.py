@@ -1,16 +1,43 @@
+import itertools
+import logging
+from functools import lru_cache, partial
+from types import MappingProxyType
+
 from django import forms
-from django.core.cache import cache
-from django.db.models import signals
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import transaction
+from django.db.models import QuerySet, signals
+from django.urls import NoReverseMatch
+from django.utils import translation
 from django.utils.translation import gettext_lazy as _
 
-from any_urlfield import EXTERNAL_SCHEMES
-from any_urlfield.cache import get_object_cache_keys
+from any_urlfield import EXTERNAL_SCHEMES, appsettings
+from any_urlfield.cache import (
+    bump_cache_generation, get_object_cache_keys, get_object_languages, get_objects_cache_keys, get_url_cache,
+    get_urlfield_language_keys,
+)
 from any_urlfield.forms.fields import ExtendedURLField
 
+logger = logging.getLogger('any_urlfield.registry')
 
-class UrlType:
+# The errors that get_absolute_url() typically raises for objects that have no URL (yet).
+URL_ERRORS = (AttributeError, LookupError, NoReverseMatch, ObjectDoesNotExist, TypeError, ValueError)
+
+# The URL types of all registries per model, which are handled by a single post_save receiver.
+_url_types_by_model = {}  # model -> {registry id: UrlType}
+_registry_ids = itertools.count()
 
-    def __init__(self, model, form_field, widget, title, prefix, has_id_value):
+
+class UrlType:
+    # Defaults for URL types that were pickled by older versions.
+    cache_timeout = None
+    cache_alias = None
+    cache_urls = True
+    url_dependents = None
+    shared_form_field = True
+
+    def __init__(self, model, form_field, widget, title, prefix, has_id_value,
+                 cache_timeout=None, cache_alias=None, cache_urls=True, url_dependents=None):
         if form_field is None:
             # Generate default form field if nothing is provided.
             if has_id_value:
@@ -18,11 +45,20 @@ class UrlType:
             else:
                 form_field = forms.CharField(widget=widget)
 
+        # A form field instance is shared by the forms, which copy it.
+        # A callable is called for each form, as it may compute values (e.g. labels, filters).
+        # This is also faster than copying a ModelChoiceField, which clones its queryset twice.
+        self.shared_form_field = not callable(form_field)
+
         self.model = model
         self.form_field = form_field
         self.title = title
         self.prefix = prefix
         self.has_id_value = has_id_value
+        self.cache_timeout = cache_timeout
+        self.cache_alias = cache_alias
+        self.cache_urls = cache_urls
+        self.url_dependents = url_dependents
 
     def __repr__(self):
         return "<UrlType {}>".format(self.prefix)
@@ -31,6 +67,8 @@ class UrlType:
         # Can't pickle lambda or callable values, so force evaluation
         dict = self.__dict__.copy()
         dict['form_field'] = self.get_form_field()
+        dict['shared_form_field'] = True
+        dict.pop('url_dependents', None)  # Only needed by the process that saves objects.
         return dict
 
     def __eq__(self, other):
@@ -54,11 +92,13 @@ class UrlType:
         else:
             return self.form_field
 
-    def get_widget(self):
+    def get_widget(self, form_field=None):
         """
         Create the widget for the URL type.
+        The widget of the ``form_field`` is used when it's given.
         """
-        form_field = self.get_form_field()
+        if form_field is None:
+            form_field = self.get_form_field()
         widget = form_field.widget
         if isinstance(widget, type):
             widget = widget()
@@ -71,27 +111,62 @@ class UrlType:
                 widget.choices = form_field_choices
         return widget
 
+    def get_cache_timeout(self):
+        """
+        Return how long the URLs of this type are cached.
+        """
+        if self.cache_timeout is None:
+            return appsettings.ANY_URLFIELD_CACHE_TIMEOUT
+        return self.cache_timeout
+
+    def get_url_cache(self):
+        """
+        Return the cache that stores the URLs of this type.
+        """
+        return get_url_cache(self.cache_alias)
+
 
 class UrlTypeRegistry:
     """
     Registration backend to administrate the various types.
+
+    Lookups by prefix or model use dictionaries that are maintained by :func:`register`,
+    so resolving database values doesn't have to scan all registered types.
+    After :func:`freeze` is called, the dispatch tables become read-only.
     """
 
     def __init__(self):
-        self._url_types = [UrlType(
+        self._id = next(_registry_ids)
+        self._url_types = ()
+        self._prefix_index = {}   # prefix -> (index, UrlType)
+        self._model_index = {}    # model -> UrlType
+        self._frozen = False
+        self._form_prototype = None
+        self._init_parse_cache()
+        self._add_url_type(UrlType(
             model=None,
             form_field=ExtendedURLField(label=_("External URL"), widget=forms.TextInput(attrs={'class': 'vTextField'})),
             widget=None,
             title=_("External URL"),
             prefix='http',   # no https needed, 'http' is a special constant.
             has_id_value=False
-        )]
+        ))
 
-    def register(self, ModelClass, form_field=None, widget=None, title=None, prefix=None, has_id_value=True):
+    def register(self, ModelClass, form_field=None, widget=None, title=None, prefix=None, has_id_value=True,
+                 cache_timeout=None, cache_alias=None, cache_urls=True, url_dependents=None):
         """
         Register a custom model with the ``AnyUrlField``.
+
+        The ``cache_timeout`` and ``cache_alias`` override the ``ANY_URLFIELD_CACHE_TIMEOUT``
+        and ``ANY_URLFIELD_CACHE_ALIAS`` settings for this model.
+        With ``cache_urls=False``, the URLs are generated each time they are read.
+
+        The ``url_dependents`` function receives a saved object, and returns the objects
+        whose URL is derived from it (e.g. the sub pages). Their cached URLs are removed too.
         """
-        if any(urltype.model == ModelClass for urltype in self._url_types):
+        if self._frozen:
+            raise RuntimeError("Can't register '{}', the URL type registry is already frozen.".format(ModelClass))
+        if ModelClass in self._model_index:
             raise ValueError("Model is already registered: '{}'".format(ModelClass))
 
         opts = ModelClass._meta
@@ -110,11 +185,75 @@ class UrlTypeRegistry:
         if form_field is not None and widget is not None:
             raise ValueError("Provide either a form_field or widget; use the widget parameter of the form field instead.")
 
-        urltype = UrlType(ModelClass, form_field, widget, title, prefix, has_id_value)
-        signals.post_save.connect(_on_model_save, sender=ModelClass)
-        self._url_types.append(urltype)
+        urltype = UrlType(ModelClass, form_field, widget, title, prefix, has_id_value,
+                          cache_timeout=cache_timeout, cache_alias=cache_alias, cache_urls=cache_urls,
+                          url_dependents=url_dependents)
+        # A strong reference, so invalidating doesn't depend on the garbage collector.
+        # The dispatch_uid connects the receiver only once, even when multiple registries have the model.
+        _url_types_by_model.setdefault(ModelClass, {})[self._id] = urltype
+        signals.post_save.connect(_on_post_save, sender=ModelClass, weak=False, dispatch_uid=(__name__, ModelClass))
+        self._add_url_type(urltype)
+        self._parse_cache.cache_clear()
+        self._form_prototype = None
         return urltype
 
+    def unregister(self, ModelClass):
+        """
+        Remove the URL type of a model, e.g. a registration that was only made for a test.
+        The cached URLs of the model are no longer removed when the objects are saved.
+        """
+        if self._frozen:
+            raise RuntimeError("Can't unregister '{}', the URL type registry is already frozen.".format(ModelClass))
+        urltype = self._model_index.get(ModelClass)
+        if urltype is None:
+            raise ValueError("Model is not registered: '{}'".format(ModelClass))
+
+        _url_types_by_model.get(ModelClass, {}).pop(self._id, None)
+
+        # The indexes of the other URL types change, so the dispatch tables are rebuilt.
+        url_types = self._url_types
+        self._url_types = ()
+        self._prefix_index = {}
+        self._model_index = {}
+        for other in url_types:
+            if other is not urltype:
+                self._add_url_type(other)
+        self._parse_cache.cache_clear()
+        self._form_prototype = None
+
+    def _add_url_type(self, urltype):
+        index = len(self._url_types)
+        self._url_types += (urltype,)
+        if urltype.prefix == 'http':
+            # Any web domain will be handled by the standard URLField,
+            # so all external schemes dispatch to the same entry.
+            for scheme in EXTERNAL_SCHEMES:
+                self._prefix_index[scheme] = (index, urltype)
+        else:
+            self._prefix_index[urltype.prefix] = (index, urltype)
+
+        if urltype.model is not None:
+            self._model_index[urltype.model] = urltype
+
+    def freeze(self):
+        """
+        Make the registry read-only.
+
+        This is typically called when all apps are loaded (see the ``ANY_URLFIELD_FREEZE_REGISTRY`` setting).
+        Afterwards, :func:`register` raises a :class:`RuntimeError`.
+        """
+        if not self._frozen:
+            self._prefix_index = MappingProxyType(dict(self._prefix_index))
+            self._model_index = MappingProxyType(dict(self._model_index))
+            self._frozen = True
+
+    @property
+    def is_frozen(self):
+        """
+        Tell whether :func:`freeze` was called.
+        """
+        return self._frozen
+
     def is_external_url_prefix(self, prefix):
         return prefix in EXTERNAL_SCHEMES
 
@@ -128,6 +267,84 @@ class UrlTypeRegistry:
     def __ne__(self, other):
         return not self == other
 
+    def __getstate__(self):
+        # The read-only dispatch tables can't be pickled, they are rebuilt instead.
+        return {'url_types': self._url_types, 'frozen': self._frozen}
+
+    def __setstate__(self, state):
+        self._id = next(_registry_ids)
+        self._url_types = ()
+        self._prefix_index = {}
+        self._model_index = {}
+        self._frozen = False
+        self._form_prototype = None
+        self._init_parse_cache()
+        # Also accept the plain ``__dict__`` that older versions pickled.
+        for urltype in state.get('url_types', state.get('_url_types', ())):
+            self._add_url_type(urltype)
+        if state.get('frozen'):
+            self.freeze()
+
+    def get_form_prototype(self):
+        """
+        Return the form fields and widgets of all URL types, which are shared by all forms.
+
+        Forms copy the prototype objects, the prototype is rebuilt after :func:`register` is called.
+        The ``form_field`` instances are copied, a ``form_field`` callable is called for each form.
+        """
+        prototype = self._form_prototype
+        if prototype is None:
+            from any_urlfield.forms.fields import AnyUrlFieldPrototype
+            prototype = self._form_prototype = AnyUrlFieldPrototype(self)
+        return prototype
+
+    def _init_parse_cache(self):
+        # Database values are highly repetitive (e.g. the same page is linked from many rows),
+        # hence the parsed results are kept in a bounded LRU cache per registry.
+        self._parse_cache = lru_cache(maxsize=appsettings.ANY_URLFIELD_PARSE_CACHE_SIZE)(self._parse_db_value)
+
+    def parse_db_value(self, url):
+        """
+        Split a serialized database value into the URL type and type value.
+        For ID-based types, the ``type_value`` is ``None`` when the database holds ``app.model://None``.
+
+        The results are cached, so only return immutable data here.
+        """
+        return self._parse_cache(url)
+
+    def _parse_db_value(self, url):
+        try:
+            prefix, url_rest = url.split('://', 2)
+        except ValueError:
+            # While expecting the field to be validated,
+            # Don't crash when there is old contents.
+            prefix = 'http'
+            url_rest = url
+
+        url_type = self[prefix]
+        if url_type is None:
+            raise ValueError("Unsupported URL prefix in database value '{}'. Supported values are: {}".format(url, self.keys()))
+
+        if url_type.has_id_value:
+            if url_rest == 'None':
+                return url_type, None
+            return url_type, int(url_rest)
+        else:
+            return url_type, url
+
+    def parse_cache_info(self):
+        """
+        Return the hits/misses statistics of the database value parser cache.
+        This returns the same named tuple as :func:`functools.lru_cache` does.
+        """
+        return self._parse_cache.cache_info()
+
+    def clear_parse_cache(self):
+        """
+        Clear the database value parser cache.
+        """
+        self._parse_cache.cache_clear()
+
     # Accessing API is similar to `list` and '`dict`:
 
     def __iter__(self):
@@ -137,33 +354,22 @@ class UrlTypeRegistry:
         """
         Return the URL type for a given model class
         """
-        for urltype in self._url_types:
-            if urltype.model is ModelClass:
-                return urltype
-        return None
+        return self._model_index.get(ModelClass)
 
     def __getitem__(self, prefix):
-        # Any web domain will be handled by the standard URLField.
-        if self.is_external_url_prefix(prefix):
-            prefix = 'http'
-
-        for urltype in self._url_types:
-            if urltype.prefix == prefix:
-                return urltype
-        return None
+        try:
+            return self._prefix_index[prefix][1]
+        except KeyError:
+            return None
 
     def index(self, prefix):
         """
         Return the model index for a prefix.
         """
-        # Any web domain will be handled by the standard URLField.
-        if self.is_external_url_prefix(prefix):
-            prefix = 'http'
-
-        for i, urltype in enumerate(self._url_types):
-            if urltype.prefix == prefix:
-                return i
-        return None
+        try:
+            return self._prefix_index[prefix][0]
+        except KeyError:
+            return None
 
     def keys(self):
         """
@@ -172,8 +378,131 @@ class UrlTypeRegistry:
         return [urltype.prefix for urltype in self._url_types]
 
 
-def _on_model_save(instance, **kwargs):
+def _on_post_save(sender, instance, raw=False, using=None, **kwargs):
+    """
+    Called when a registered model is saved.
+    When the model is registered in multiple registries, each cache is only updated once.
+    The keys of the object and its dependents are removed with a single ``delete_many()`` per cache.
+
+    With ``ANY_URLFIELD_CACHE_WRITE_THROUGH``, the new URLs are written once the transaction commits,
+    so a rollback doesn't leave the URLs of unsaved data in the cache.
+    Objects that are loaded from fixtures (``raw=True``) are only invalidated.
+    """
+    keys_by_alias = {}
+    saved_aliases = set()  # The caches that the saved object is invalidated in, the dependents may use others.
+    url_dependents = set()
+    writes = []
+    write_through = appsettings.ANY_URLFIELD_CACHE_WRITE_THROUGH and not raw
+    for url_type in list(_url_types_by_model.get(sender, {}).values()):
+        if not url_type.cache_urls:
+            continue
+
+        if url_type.cache_alias not in saved_aliases:
+            saved_aliases.add(url_type.cache_alias)
+            if write_through:
+                # Read before the keys are removed, or the generation is incremented.
+                writes.append((url_type, _get_object_languages(instance, url_type)))
+            keys_by_alias.setdefault(url_type.cache_alias, []).extend(_on_model_save(instance, url_type))
+
+        if url_type.url_dependents is not None and url_type.url_dependents not in url_dependents:
+            url_dependents.add(url_type.url_dependents)
+            _invalidate_dependents(instance, url_type, keys_by_alias)
+
+    for cache_alias, cache_keys in keys_by_alias.items():
+        if cache_keys:
+            get_url_cache(cache_alias).delete_many(cache_keys)
+
+    # Without a transaction, on_commit() runs the function immediately, hence this happens after deleting.
+    for url_type, languages in writes:
+        transaction.on_commit(partial(_write_object_urls, instance, url_type, languages), using=using)
+
+
+def _on_model_save(instance, url_type):
     """
     Called when a model is saved.
+    This returns the cached URLs to remove, which also removes them from the local in-process cache.
+    """
+    if appsettings.ANY_URLFIELD_CACHE_INVALIDATION == 'generation':
+        bump_cache_generation(instance.__class__, url_type.cache_alias)
+        return []
+    else:
+        return get_object_cache_keys(instance, url_type.cache_alias)
+
+
+def _invalidate_dependents(instance, url_type, keys_by_alias):
+    """
+    Remove the cached URLs of the objects that depend on the saved object.
+    These are stored in the caches of their own URL types, the keys are added to ``keys_by_alias``.
+    """
+    dependents = url_type.url_dependents(instance)
+
+    if appsettings.ANY_URLFIELD_CACHE_INVALIDATION == 'generation':
+        # A single increment per model, the model of the saved object is already incremented.
+        # For a queryset, the objects don't have to be fetched to know their model.
+        if isinstance(dependents, QuerySet):
+            models = {dependents.model}
+        else:
+            models = {dependent.__class__ for dependent in dependents}
+        for model in models - {instance.__class__}:
+            for cache_alias in _get_cache_aliases(model):
+                bump_cache_generation(model, cache_alias)
+        return
+
+    pks_by_model = {}
+    for dependent in dependents:
+        pks_by_model.setdefault(dependent.__class__, set()).add(dependent.pk)
+
+    for model, pks in pks_by_model.items():
+        for cache_alias in _get_cache_aliases(model):
+            keys_by_alias.setdefault(cache_alias, []).extend(get_objects_cache_keys(model, pks, cache_alias))
+
+
+def _get_cache_aliases(model):
+    # The caches that the URL types of all registries store the URLs of the model in.
+    return {url_type.cache_alias for url_type in _url_types_by_model.get(model, {}).values() if url_type.cache_urls}
+
+
+def _write_object_urls(instance, url_type, languages):
+    """
+    Store the URLs of an object in the given languages.
+    With ``ANY_URLFIELD_CACHE_WRITE_CACHED_LANGUAGES_ONLY``, these are the languages that were cached.
     """
-    cache.delete_many(get_object_cache_keys(instance))
+    cache_keys = get_urlfield_language_keys(instance.__class__, instance.pk, languages, url_type.cache_alias)
+    urls = {}
+    failed = {}  # language -> error
+    for language, cache_key in cache_keys.items():
+        try:
+            urls[cache_key] = _get_absolute_url(instance, language)
+        except URL_ERRORS as e:
+            # Never let saving the object fail, the URL is generated on demand instead.
+            failed[language] = e
+
+    if failed:
+        language, error = next(iter(failed.items()))
+        logger.warning(
+            "Failed to generate URL for %r in %d language(s), e.g. %s: %s", instance, len(failed), language, error
+        )
+        # Another request may have cached the previous URL before the transaction was committed.
+        url_type.get_url_cache().delete_many([cache_keys[language] for language in failed])
+    if urls:
+        url_type.get_url_cache().set_many(urls, url_type.get_cache_timeout())
+
+
+def _get_object_languages(instance, url_type):
+    if not instance.pk or instance._state.adding:
+        return ()
+    return get_object_languages(instance, url_type.cache_alias)
+
+
+def _get_absolute_url(instance, language):
+    with translation.override(language):
+        try:
+            current_language = instance.get_current_language()  # django-parler
+        except AttributeError:
+            return instance.get_absolute_url()
+
+        instance.set_current_language(language)
+        try:
+            return instance.get_absolute_url()
+        finally:
+            instance.set_current_language(current_language)
@@ -29,6 +29,34 @@
       var slugvalue = this.value.replace(/[^a-z0-9-_]/, '');
       var pane = widget.siblings(".any_urlfield-url-" + slugvalue);
       pane[ this.checked ? "show" : "hide" ]();
+      if(this.checked) {
+        loadPlaceholder(widget, pane);
+      }
+    });
+  }
+
+  function loadPlaceholder(widget, pane)
+  {
+    // The lazy AnyUrlWidget only renders the selected type, fetch the others on demand.
+    var placeholder = pane.find('.any_urlfield-placeholder');
+    if(! placeholder.length || placeholder.data('loading')) {
+      return;
+    }
+
+    // Derive the field names from the type selector, as formsets may have renumbered them.
+    var index = placeholder.attr('data-index');
+    var params = {name: widget.find('input').attr('name').replace(/_0$/, '_' + index)};
+    if(widget.attr('id')) {
+      params.id = widget.attr('id').replace(/_0$/, '_' + index);
+    }
+
+    placeholder.data('loading', true);
+    $.get(placeholder.attr('data-url'), params, function(html){
+      placeholder.replaceWith(html);
+      // A DOM event, other scripts may use a different jQuery instance.
+      pane[0].dispatchEvent(new CustomEvent('any_urlfield:loaded', {bubbles: true}));
+    }).fail(function(){
+      placeholder.data('loading', false);
     });
   }
 
@@ -0,0 +1,32 @@
+(function($)
+{
+  $(document).ready(function(){
+    initSearch($('select.any_urlfield-search'));
+
+    // New inline formset rows
+    $(document).on('formset:added', function(event, $row){
+      initSearch(($row || $(event.target)).find('select.any_urlfield-search'));
+    });
+
+    // Widgets that the lazy AnyUrlWidget fetched
+    document.addEventListener('any_urlfield:loaded', function(event){
+      initSearch($(event.target).find('select.any_urlfield-search'));
+    });
+  });
+
+
+  function initSearch(selects)
+  {
+    selects.not('[name*=__prefix__]').each(function(){
+      // The URL and other options are read from the data-* attributes.
+      $(this).select2({
+        ajax: {
+          data: function(params) {
+            return {term: params.term, page: params.page};
+          }
+        }
+      });
+    });
+  }
+
+})((window.django && window.django.jQuery) || window.jQuery);
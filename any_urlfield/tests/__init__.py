@@ -1,5 +1,6 @@
+from any_urlfield.admin import AnyUrlFieldAdminMixin
 from any_urlfield.forms import SimpleRawIdWidget
-from any_urlfield.models import AnyUrlField
+from any_urlfield.models import AnyUrlField, AnyUrlManager
 from django.contrib import admin
 from django.db import models
 
@@ -17,6 +18,37 @@ class UrlModel(models.Model):
         return str(self.url)
 
 
+class LazyUrlModel(models.Model):
+    """
+    Example model with a lazy AnyUrlField.
+    """
+    url = AnyUrlField(lazy=True)
+
+
+class AutoResolveUrlModel(models.Model):
+    """
+    Example model that resolves the values of a query together.
+    """
+    url = AnyUrlField(auto_resolve=True)
+
+
+class LinkListModel(models.Model):
+    """
+    Example model with related links.
+    """
+    title = models.CharField(max_length=200)
+
+
+class LinkModel(models.Model):
+    """
+    Example model, using the custom manager.
+    """
+    parent = models.ForeignKey(LinkListModel, related_name='links', on_delete=models.CASCADE)
+    url = AnyUrlField()
+
+    objects = AnyUrlManager()
+
+
 class PageModel(models.Model):
     """
     Example model to be linking to.
@@ -42,3 +74,19 @@ class RegPageModel(models.Model):
 
 AnyUrlField.register_model(RegPageModel, widget=SimpleRawIdWidget(RegPageModel))
 admin.site.register(RegPageModel)  # Needed for SimpleRawIdWidget to render
+
+
+class LinkInline(admin.TabularInline):
+    model = LinkModel
+    extra = 0
+
+
+@admin.register(LinkListModel)
+class LinkListAdmin(AnyUrlFieldAdminMixin, admin.ModelAdmin):
+    inlines = [LinkInline]
+
+
+@admin.register(UrlModel)
+class UrlModelAdmin(AnyUrlFieldAdminMixin, admin.ModelAdmin):
+    list_display = ('id', 'url')
+    list_editable = ('url',)
@@ -0,0 +1,72 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from any_urlfield.forms.widgets import _get_change_url_format
+from any_urlfield.models import AnyUrlValue
+from any_urlfield.tests import LinkListModel, LinkModel, RegPageModel, UrlModel
+
+
+class AdminTests(TestCase):
+    """
+    Test the admin pages with raw ID widgets.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_superuser('admin', 'admin@example.com', 'admin')
+        self.client.force_login(self.user)
+        self.addCleanup(cache.clear)
+
+    def _count_queries(self, url):
+        # The pages display cached URLs, avoid sharing these with other requests and tests.
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def _create_pages(self, num):
+        return [RegPageModel.objects.create(slug='admin') for i in range(num)]
+
+    def test_inline_queries(self):
+        """
+        The objects of the raw ID widgets in the inlines are fetched with a single query.
+        """
+        link_list = LinkListModel.objects.create(title='small')
+        for page in self._create_pages(2):
+            LinkModel.objects.create(parent=link_list, url=AnyUrlValue.from_model(page))
+        url = '/admin/any_urlfield/linklistmodel/{}/change/'.format(link_list.pk)
+        self._count_queries(url)  # The first request also loads the session and content types.
+        expected = self._count_queries(url)
+
+        for page in self._create_pages(8):
+            LinkModel.objects.create(parent=link_list, url=AnyUrlValue.from_model(page))
+        self.assertEqual(self._count_queries(url), expected)
+
+    def test_changelist_queries(self):
+        """
+        The objects of the raw ID widgets in the list_editable forms are fetched with a single query,
+        and the displayed URLs are generated with a single query.
+        """
+        for page in self._create_pages(2):
+            UrlModel.objects.create(url=AnyUrlValue.from_model(page))
+        url = '/admin/any_urlfield/urlmodel/'
+        self._count_queries(url)  # The first request also loads the session and content types.
+        expected = self._count_queries(url)
+
+        for page in self._create_pages(8):
+            UrlModel.objects.create(url=AnyUrlValue.from_model(page))
+        self.assertEqual(self._count_queries(url), expected)
+
+    def test_change_url_cache(self):
+        """
+        The cached admin URLs are cleared when the URLconf changes.
+        """
+        _get_change_url_format('admin', 'any_urlfield', 'regpagemodel', None, '/')
+        self.assertEqual(_get_change_url_format.cache_info().currsize, 1)
+        with override_settings(ROOT_URLCONF='any_urlfield.urls'):
+            self.assertEqual(_get_change_url_format.cache_info().currsize, 0)
+            self.assertEqual(_get_change_url_format('admin', 'any_urlfield', 'regpagemodel', None, '/'), '')
+        self.assertEqual(_get_change_url_format.cache_info().currsize, 0)
@@ -0,0 +1,636 @@
+import threading
+import time
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.db import transaction
+from django.test import TestCase, TransactionTestCase
+from django.utils import translation
+
+from any_urlfield.cache import (
+    MAX_KEY_LENGTH, LocalUrlCache, UrlCache, get_cache_generation, get_cached_languages,
+    get_objects_cache_keys, get_urlfield_cache_key, get_urlfield_cache_keys, single_flight,
+)
+from any_urlfield.models import AnyUrlValue
+from any_urlfield.registry import UrlTypeRegistry
+from any_urlfield.tests import PageModel, RegPageModel
+
+
+class CacheTestCase(TestCase):
+    """
+    Avoid sharing cached URLs with other tests, as these use the same object ID's.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+
+class LocalUrlCacheTests(TestCase):
+    """
+    Test the in-process URL cache.
+    """
+
+    def test_lru(self):
+        """
+        The least recently used entries are removed first.
+        """
+        local_cache = LocalUrlCache(max_entries=2, timeout=60)
+        local_cache.set_many({'a': '/a/', 'b': '/b/'})
+        self.assertEqual(local_cache.get_many(['a']), {'a': '/a/'})
+
+        local_cache.set_many({'c': '/c/'})
+        self.assertEqual(local_cache.get_many(['a', 'b', 'c']), {'a': '/a/', 'c': '/c/'})
+        self.assertEqual(local_cache.get_stats(), {'hits': 3, 'misses': 1, 'entries': 2, 'max_entries': 2})
+
+    def test_timeout(self):
+        """
+        Entries expire, also when the shared cache timeout is shorter.
+        """
+        local_cache = LocalUrlCache(max_entries=10, timeout=60)
+        with mock.patch('any_urlfield.cache.time.monotonic', return_value=1000):
+            local_cache.set_many({'a': '/a/'})
+            local_cache.set_many({'b': '/b/'}, timeout=10)
+
+        with mock.patch('any_urlfield.cache.time.monotonic', return_value=1030):
+            self.assertEqual(local_cache.get_many(['a', 'b']), {'a': '/a/'})
+        with mock.patch('any_urlfield.cache.time.monotonic', return_value=1070):
+            self.assertEqual(local_cache.get_many(['a', 'b']), {})
+        self.assertEqual(local_cache.get_stats()['entries'], 0)
+
+
+class UrlCacheTests(CacheTestCase):
+    """
+    Test the two-tier URL cache.
+    """
+
+    def test_local_cache(self):
+        """
+        The local cache is filled by reads and writes, and avoids reading the backend.
+        """
+        url_cache = UrlCache(local_cache=LocalUrlCache(max_entries=10, timeout=60))
+        cache.set('test.a', '/a/')
+        url_cache.set('test.b', '/b/', 60)
+
+        self.assertEqual(url_cache.get_many(['test.a', 'test.b']), {'test.a': '/a/', 'test.b': '/b/'})
+        self.assertEqual(cache.get('test.b'), '/b/')
+
+        with mock.patch.object(cache, 'get_many') as mock_get_many:
+            self.assertEqual(url_cache.get('test.a'), '/a/')
+        mock_get_many.assert_not_called()
+
+        url_cache.delete_many(['test.a'])
+        self.assertIsNone(url_cache.get('test.a'))
+        self.assertIsNone(cache.get('test.a'))
+
+    def test_save_invalidates(self):
+        """
+        Saving the object removes the URL from the local cache too.
+        """
+        local_cache = LocalUrlCache(max_entries=10, timeout=60)
+        page = RegPageModel.objects.create(slug='local')
+        cache_key = get_urlfield_cache_key(RegPageModel, page.pk, 'en')
+
+        with mock.patch('any_urlfield.registry.get_url_cache', return_value=UrlCache(local_cache=local_cache)):
+            local_cache.set_many({cache_key: '/local/'})
+            page.save()
+        self.assertEqual(local_cache.get_many([cache_key]), {})
+
+
+class CachePolicyTests(CacheTestCase):
+    """
+    Test the cache settings per URL type.
+    """
+
+    def setUp(self):
+        super().setUp()
+        caches['urls'].clear()
+        self.addCleanup(caches['urls'].clear)
+
+    def test_cache_alias(self):
+        """
+        The URLs are stored in the cache of the URL type, and removed from it on save.
+        """
+        reg = UrlTypeRegistry()
+        urltype = reg.register(PageModel, cache_alias='urls')
+        self.addCleanup(reg.unregister, PageModel)
+        page = PageModel.objects.create(slug='alias')
+        cache_key = get_urlfield_cache_key(PageModel, page.pk, 'nl')
+
+        with translation.override('nl'):
+            self.assertEqual(str(AnyUrlValue(urltype.prefix, page.pk, reg)), '/alias/')
+        self.assertEqual(caches['urls'].get(cache_key), '/alias/')
+        self.assertIsNone(cache.get(cache_key))
+
+        page.save()
+        self.assertIsNone(caches['urls'].get(cache_key))
+
+    def test_cache_timeout(self):
+        """
+        The timeout of the URL type is used by both str() and render_urls().
+        """
+        reg = UrlTypeRegistry()
+        urltype = reg.register(PageModel, cache_alias='urls', cache_timeout=10)
+        self.addCleanup(reg.unregister, PageModel)
+        page1 = PageModel.objects.create(slug='timeout1')
+        page2 = PageModel.objects.create(slug='timeout2')
+
+        with mock.patch.object(caches['urls'], 'set_many', wraps=caches['urls'].set_many) as mock_set_many:
+            str(AnyUrlValue(urltype.prefix, page1.pk, reg))
+            AnyUrlValue.render_urls([AnyUrlValue(urltype.prefix, page2.pk, reg)])
+        self.assertEqual([call.args[1] for call in mock_set_many.call_args_list], [10, 10])
+
+    def test_cache_disabled(self):
+        """
+        URL types can opt out of caching, the URL is still remembered by the value itself.
+        """
+        reg = UrlTypeRegistry()
+        urltype = reg.register(PageModel, cache_urls=False)
+        page = PageModel.objects.create(slug='nocache')
+
+        with mock.patch.object(cache, 'get_many') as mock_get_many, \
+                mock.patch.object(cache, 'set_many') as mock_set_many:
+            value = AnyUrlValue(urltype.prefix, page.pk, reg)
+            with self.assertNumQueries(1):
+                self.assertEqual(str(value), '/nocache/')
+                self.assertEqual(str(value), '/nocache/')
+
+            values = [AnyUrlValue(urltype.prefix, page.pk, reg), AnyUrlValue(urltype.prefix, 999999, reg)]
+            with self.assertNumQueries(1):
+                self.assertEqual(AnyUrlValue.render_urls(values), ['/nocache/', '#DoesNotExist'])
+
+            with mock.patch.object(cache, 'delete_many') as mock_delete_many:
+                page.save()
+        mock_get_many.assert_not_called()
+        mock_set_many.assert_not_called()
+        mock_delete_many.assert_not_called()
+
+
+class CachedLanguagesTests(CacheTestCase):
+    """
+    Test reading the cached languages per object.
+    """
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch('any_urlfield.appsettings.ANY_URLFIELD_CACHE_WRITE_CACHED_LANGUAGES_ONLY', True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_cached_languages(self):
+        page1 = RegPageModel.objects.create(slug='index1')
+        page2 = RegPageModel.objects.create(slug='index2')
+        with translation.override('nl'):
+            str(AnyUrlValue.from_model(page1))
+        with translation.override('de'):
+            str(AnyUrlValue.from_model(page1))
+            AnyUrlValue.render_urls([AnyUrlValue.from_model(page1), AnyUrlValue.from_model(page2)])
+
+        self.assertEqual(
+            get_cached_languages(RegPageModel, [page1.pk, page2.pk, 999999]),
+            {page1.pk: {'nl', 'de'}, page2.pk: {'de'}}
+        )
+
+    def test_save_deletes_all_languages(self):
+        """
+        Without write-through, saving removes the keys of all languages without reading them first.
+        """
+        page = RegPageModel.objects.create(slug='index')
+        with translation.override('nl'):
+            str(AnyUrlValue.from_model(page))
+
+        with mock.patch.object(cache, 'get_many', wraps=cache.get_many) as mock_get_many, \
+                mock.patch.object(cache, 'delete_many', wraps=cache.delete_many) as mock_delete_many:
+            page.save()
+        mock_get_many.assert_not_called()
+        self.assertEqual(len(mock_delete_many.call_args.args[0]), len(settings.LANGUAGES))
+        self.assertEqual(get_cached_languages(RegPageModel, [page.pk]), {})
+
+
+class DependentsTests(CacheTestCase):
+    """
+    Test invalidating the URLs of objects that depend on the saved object.
+    """
+
+    def _register(self):
+        reg = UrlTypeRegistry()
+        urltype = reg.register(PageModel, url_dependents=lambda page: PageModel.objects.filter(slug__startswith=page.slug + '-'))
+        self.addCleanup(reg.unregister, PageModel)
+        return reg, urltype
+
+    def test_save_deletes_dependents(self):
+        reg, urltype = self._register()
+        parent = PageModel.objects.create(slug='parent')
+        child = PageModel.objects.create(slug='parent-child')
+        other = PageModel.objects.create(slug='other')
+
+        with translation.override('nl'):
+            AnyUrlValue.render_urls([AnyUrlValue(urltype.prefix, page.pk, reg) for page in (parent, child, other)])
+
+        with mock.patch.object(cache, 'delete_many', wraps=cache.delete_many) as mock_delete_many:
+            parent.save()
+        self.assertEqual(mock_delete_many.call_count, 1)
+        self.assertIsNone(cache.get(get_urlfield_cache_key(PageModel, parent.pk, 'nl')))
+        self.assertIsNone(cache.get(get_urlfield_cache_key(PageModel, child.pk, 'nl')))
+        self.assertEqual(cache.get(get_urlfield_cache_key(PageModel, other.pk, 'nl')), '/other/')
+
+    def test_save_generation(self):
+        """
+        With generation based invalidation, the dependents of the same model don't need any work.
+        """
+        reg, urltype = self._register()
+        parent = PageModel.objects.create(slug='parent')
+        PageModel.objects.create(slug='parent-child')
+
+        with mock.patch('any_urlfield.appsettings.ANY_URLFIELD_CACHE_INVALIDATION', 'generation'), \
+                mock.patch('any_urlfield.registry.bump_cache_generation') as mock_bump, \
+                self.assertNumQueries(1):
+            parent.save()  # Only the UPDATE query, the dependents are not fetched.
+        mock_bump.assert_called_once_with(PageModel, None)
+
+    def test_save_dependents_cache_alias(self):
+        """
+        The dependents are removed from the cache of their own URL type.
+        """
+        reg = UrlTypeRegistry()
+        reg.register(PageModel, url_dependents=lambda page: RegPageModel.objects.filter(slug=page.slug))
+        reg.register(RegPageModel, cache_alias='urls')
+        self.addCleanup(reg.unregister, PageModel)
+        self.addCleanup(reg.unregister, RegPageModel)
+        page = PageModel.objects.create(slug='dependent')
+        reg_page = RegPageModel.objects.create(slug='dependent')
+
+        with mock.patch.object(cache, 'delete_many') as mock_delete_many, \
+                mock.patch.object(caches['urls'], 'delete_many') as mock_urls_delete_many:
+            page.save()
+        # The default cache is used by the registry of the model field.
+        mock_delete_many.assert_called_once()
+        self.assertIn(get_urlfield_cache_key(RegPageModel, reg_page.pk, 'nl'), mock_delete_many.call_args.args[0])
+        self.assertIn(get_urlfield_cache_key(PageModel, page.pk, 'nl'), mock_delete_many.call_args.args[0])
+        mock_urls_delete_many.assert_called_once_with(get_objects_cache_keys(RegPageModel, [reg_page.pk], 'urls'))
+
+    def test_save_multiple_registries(self):
+        """
+        A model that is registered in multiple registries is only invalidated once per cache.
+        """
+        reg, urltype = self._register()
+        reg2 = UrlTypeRegistry()
+        reg2.register(PageModel)
+        self.addCleanup(reg2.unregister, PageModel)
+        page = PageModel.objects.create(slug='multiple')
+
+        with mock.patch.object(cache, 'delete_many') as mock_delete_many:
+            page.save()
+        self.assertEqual(mock_delete_many.call_count, 1)
+
+    def test_save_multiple_registries_dependents(self):
+        """
+        A cache that already holds dependents still removes the keys of the saved object.
+        """
+        reg, urltype = self._register()
+        reg2 = UrlTypeRegistry()
+        reg2.register(PageModel, cache_alias='urls')
+        self.addCleanup(reg2.unregister, PageModel)
+        page = PageModel.objects.create(slug='parent')
+        child = PageModel.objects.create(slug='parent-child')
+
+        with mock.patch.object(caches['urls'], 'delete_many') as mock_urls_delete_many:
+            page.save()
+        mock_urls_delete_many.assert_called_once()
+        self.assertIn(get_urlfield_cache_key(PageModel, page.pk, 'nl'), mock_urls_delete_many.call_args.args[0])
+        self.assertIn(get_urlfield_cache_key(PageModel, child.pk, 'nl'), mock_urls_delete_many.call_args.args[0])
+
+    def test_unregister(self):
+        """
+        The dependents are no longer invalidated when the model is unregistered.
+        """
+        reg = UrlTypeRegistry()
+        reg.register(PageModel, url_dependents=lambda page: PageModel.objects.filter(slug__startswith=page.slug + '-'))
+        reg.unregister(PageModel)
+        self.assertIsNone(reg.get_for_model(PageModel))
+        self.assertEqual(reg.keys(), ['http'])
+
+        page = PageModel.objects.create(slug='unregistered')
+        with self.assertNumQueries(1):
+            page.save()
+
+
+class CacheKeyTests(TestCase):
+    """
+    Test the cache key generation.
+    """
+
+    def test_cache_key(self):
+        self.assertEqual(get_urlfield_cache_key(RegPageModel, 12, 'nl'), 'anyurlfield.any_urlfield.RegPageModel.12.nl')
+        self.assertEqual(
+            get_urlfield_cache_keys(RegPageModel, [1, 2], 'nl'),
+            ['anyurlfield.any_urlfield.RegPageModel.1.nl', 'anyurlfield.any_urlfield.RegPageModel.2.nl']
+        )
+
+    def test_cache_key_without_language(self):
+        """
+        Translations may be deactivated, e.g. in management commands.
+        """
+        with translation.override(None):
+            self.assertEqual(get_urlfield_cache_key(RegPageModel, 12), 'anyurlfield.any_urlfield.RegPageModel.12.None')
+            self.assertEqual(get_urlfield_cache_keys(RegPageModel, [12]), ['anyurlfield.any_urlfield.RegPageModel.12.None'])
+
+    def test_long_cache_key(self):
+        """
+        Long keys are shortened to stay within the memcached limit.
+        """
+        key = get_urlfield_cache_key(RegPageModel, 'x' * 300, 'nl')
+        self.assertLessEqual(len(key), MAX_KEY_LENGTH)
+        self.assertTrue(key.startswith('anyurlfield.'))
+        self.assertNotEqual(key, get_urlfield_cache_key(RegPageModel, 'x' * 299, 'nl'))
+
+    def test_hashed_cache_key(self):
+        """
+        The model name can be replaced with a short hash.
+        """
+        with mock.patch('any_urlfield.cache.appsettings.ANY_URLFIELD_CACHE_KEY_HASH', True), \
+                mock.patch('any_urlfield.cache._key_prefixes', {}):
+            key = get_urlfield_cache_key(RegPageModel, 12, 'nl')
+        self.assertRegex(key, r'^anyurlfield\.[0-9a-f]{8}\.12\.nl$')
+
+
+class GenerationInvalidationTests(CacheTestCase):
+    """
+    Test the generation based cache invalidation.
+    """
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch('any_urlfield.appsettings.ANY_URLFIELD_CACHE_INVALIDATION', 'generation')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_generation_key(self):
+        generation = get_cache_generation(RegPageModel)
+        self.assertEqual(
+            get_urlfield_cache_key(RegPageModel, 12, 'nl'),
+            'anyurlfield.any_urlfield.RegPageModel.g{}.12.nl'.format(generation)
+        )
+
+    def test_save_bumps_generation(self):
+        """
+        Saving an object increments the generation, so old URLs are no longer read.
+        """
+        page = RegPageModel.objects.create(slug='gen1')
+        value = AnyUrlValue.from_model(page)
+        self.assertEqual(str(value), '/gen1/')
+        generation = get_cache_generation(RegPageModel)
+
+        page.slug = 'gen2'
+        with mock.patch.object(cache, 'delete_many') as mock_delete_many:
+            page.save()
+        mock_delete_many.assert_not_called()
+        self.assertEqual(get_cache_generation(RegPageModel), generation + 1)
+        self.assertEqual(str(AnyUrlValue.from_model(page)), '/gen2/')
+
+    def test_local_cache_generation(self):
+        """
+        The in-process cache keeps the generation, so building a key doesn't read the backend.
+        """
+        local_url_cache = UrlCache(local_cache=LocalUrlCache(max_entries=10, timeout=60))
+        with mock.patch('any_urlfield.cache.url_cache', local_url_cache):
+            generation = get_cache_generation(RegPageModel)
+            with mock.patch.object(cache, 'get_many') as mock_get_many:
+                self.assertEqual(get_cache_generation(RegPageModel), generation)
+        mock_get_many.assert_not_called()
+
+
+class WriteThroughTests(TransactionTestCase):
+    """
+    Test writing the URLs to the cache when an object is saved.
+    The URLs are written when the transaction is committed, so this doesn't run inside a transaction.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        patcher = mock.patch('any_urlfield.appsettings.ANY_URLFIELD_CACHE_WRITE_THROUGH', True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_save_writes_urls(self):
+        page = RegPageModel.objects.create(slug='write1')
+        page.slug = 'write2'
+        page.save()
+        self.assertEqual(cache.get(get_urlfield_cache_key(RegPageModel, page.pk, 'nl')), '/write2/')
+
+        value = AnyUrlValue.from_model(page)
+        with self.assertNumQueries(0), translation.override('nl'):
+            self.assertEqual(str(value), '/write2/')
+
+    def test_save_on_commit(self):
+        """
+        The URLs are written once the transaction commits, a rollback only removes them.
+        """
+        page = RegPageModel.objects.create(slug='write1')
+        cache_key = get_urlfield_cache_key(RegPageModel, page.pk, 'nl')
+        self.assertEqual(cache.get(cache_key), '/write1/')
+
+        page.slug = 'write2'
+        with transaction.atomic():
+            page.save()
+            self.assertIsNone(cache.get(cache_key))
+        self.assertEqual(cache.get(cache_key), '/write2/')
+
+        page.slug = 'write3'
+        with self.assertRaises(ValueError), transaction.atomic():
+            page.save()
+            raise ValueError("Rollback")
+        self.assertIsNone(cache.get(cache_key))
+
+    def test_save_raw(self):
+        """
+        Loading fixtures doesn't generate the URLs, these are only removed.
+        """
+        page = RegPageModel.objects.create(slug='write1')
+        cache_key = get_urlfield_cache_key(RegPageModel, page.pk, 'nl')
+
+        with mock.patch.object(RegPageModel, 'get_absolute_url') as mock_get_absolute_url:
+            page.save_base(raw=True)
+        mock_get_absolute_url.assert_not_called()
+        self.assertIsNone(cache.get(cache_key))
+
+    def test_save_failure(self):
+        """
+        URLs that can't be generated are removed, and don't break saving.
+        """
+        page = RegPageModel.objects.create(slug='write1')
+        cache_key = get_urlfield_cache_key(RegPageModel, page.pk, 'nl')
+        cache.set(cache_key, '/old/')
+
+        with mock.patch.object(RegPageModel, 'get_absolute_url', side_effect=ValueError("No URL")), \
+                self.assertLogs('any_urlfield.registry', 'WARNING') as logs:
+            page.save()
+        self.assertIsNone(cache.get(cache_key))
+        self.assertEqual(len(logs.output), 1)  # Not once per language
+
+    def test_save_generation(self):
+        """
+        With generation based invalidation, the URLs are written with the new generation.
+        """
+        page = RegPageModel.objects.create(slug='write1')
+        with mock.patch('any_urlfield.appsettings.ANY_URLFIELD_CACHE_INVALIDATION', 'generation'):
+            page.save()
+            self.assertEqual(cache.get(get_urlfield_cache_key(RegPageModel, page.pk, 'nl')), '/write1/')
+
+    @mock.patch('any_urlfield.appsettings.ANY_URLFIELD_CACHE_WRITE_CACHED_LANGUAGES_ONLY', True)
+    def test_save_cached_languages(self):
+        """
+        Optionally, only the cached languages are generated again.
+        """
+        page = RegPageModel.objects.create(slug='index1')
+        cache.clear()
+        with translation.override('nl'):
+            str(AnyUrlValue.from_model(page))
+
+        page.slug = 'index2'
+        with mock.patch.object(cache, 'set_many', wraps=cache.set_many) as mock_set_many:
+            page.save()
+        mock_set_many.assert_called_once()
+        self.assertEqual(list(mock_set_many.call_args.args[0]), [get_urlfield_cache_key(RegPageModel, page.pk, 'nl')])
+        self.assertEqual(get_cached_languages(RegPageModel, [page.pk]), {page.pk: {'nl'}})
+
+    @mock.patch('any_urlfield.appsettings.ANY_URLFIELD_CACHE_WRITE_CACHED_LANGUAGES_ONLY', True)
+    def test_save_cached_languages_generation(self):
+        """
+        The cached languages are read before the generation is incremented.
+        """
+        page = RegPageModel.objects.create(slug='index1')
+        cache.clear()
+        with mock.patch('any_urlfield.appsettings.ANY_URLFIELD_CACHE_INVALIDATION', 'generation'):
+            with translation.override('nl'):
+                str(AnyUrlValue.from_model(page))
+
+            page.slug = 'index2'
+            page.save()
+            self.assertEqual(get_cached_languages(RegPageModel, [page.pk]), {page.pk: {'nl'}})
+            with translation.override('nl'):
+                self.assertEqual(str(AnyUrlValue.from_model(page)), '/index2/')
+
+
+class NegativeCacheTests(CacheTestCase):
+    """
+    Test caching of links to objects that don't exist.
+    """
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.dict('any_urlfield.models.values._missing_logged', clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @translation.override('nl')
+    def test_missing_object(self):
+        value = AnyUrlValue('any_urlfield.regpagemodel', 999999)
+        with self.assertLogs('any_urlfield.models', 'ERROR'):
+            self.assertEqual(str(value), '#DoesNotExist')
+
+        # Next renders don't query or log the error again.
+        value = AnyUrlValue('any_urlfield.regpagemodel', 999999)
+        with self.assertNumQueries(0):
+            self.assertEqual(str(value), '#DoesNotExist')
+            self.assertEqual(AnyUrlValue.render_urls([value]), ['#DoesNotExist'])
+
+        # Creating the object invalidates the entry.
+        page = RegPageModel.objects.create(pk=999999, slug='created')
+        self.assertEqual(str(AnyUrlValue.from_model(page)), '/created/')
+
+    def test_log_rate_limit(self):
+        """
+        Without a cache entry, the error is still logged once.
+        """
+        with self.assertLogs('any_urlfield.models', 'DEBUG') as logs:
+            for i in range(3):
+                cache.clear()
+                self.assertEqual(str(AnyUrlValue('any_urlfield.regpagemodel', 888888)), '#DoesNotExist')
+        self.assertEqual([record.levelname for record in logs.records], ['ERROR', 'DEBUG', 'DEBUG'])
+
+
+class SingleFlightTests(CacheTestCase):
+    """
+    Test the stampede protection for missing URLs.
+    """
+
+    def _generate(self, calls):
+        def _generate():
+            calls.append(1)
+            time.sleep(0.1)
+            cache.set('test.url', '/url/')
+            return '/url/'
+        return _generate
+
+    def test_threads(self):
+        """
+        Only one thread generates the URL, the others receive it.
+        """
+        calls = []
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(single_flight('test.url', self._generate(calls))))
+            for i in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, ['/url/'] * 5)
+        self.assertEqual(len(calls), 1)
+
+    def test_lease(self):
+        """
+        When another process holds the lease, its result is awaited.
+        """
+        calls = []
+        cache.add('test.url.lease', 1)
+        timer = threading.Timer(0.1, lambda: cache.set('test.url', '/other/'))
+        timer.start()
+        self.assertEqual(single_flight('test.url', self._generate(calls)), '/other/')
+        timer.join()
+        self.assertEqual(calls, [])
+
+    def test_lease_timeout(self):
+        """
+        When the other process takes too long, the URL is generated anyway.
+        """
+        calls = []
+        cache.add('test.url.lease', 1)
+        with mock.patch('any_urlfield.appsettings.ANY_URLFIELD_CACHE_LOCK_TIMEOUT', 0.1):
+            self.assertEqual(single_flight('test.url', self._generate(calls)), '/url/')
+        self.assertEqual(len(calls), 1)
+
+    def test_lock_timeout(self):
+        """
+        A hanging thread doesn't block the others forever.
+        """
+        calls = []
+        started = threading.Event()
+        release = threading.Event()
+
+        def _hang():
+            started.set()
+            release.wait(5)
+            return '/hang/'
+
+        thread = threading.Thread(target=lambda: single_flight('test.url', _hang))
+        thread.start()
+        started.wait(5)
+        try:
+            with mock.patch('any_urlfield.appsettings.ANY_URLFIELD_CACHE_LOCK_TIMEOUT', 0.1):
+                self.assertEqual(single_flight('test.url', self._generate(calls)), '/url/')
+        finally:
+            release.set()
+            thread.join()
+        self.assertEqual(len(calls), 1)
+
+    def test_str(self):
+        page = RegPageModel.objects.create(slug='single')
+        with mock.patch('any_urlfield.appsettings.ANY_URLFIELD_CACHE_SINGLE_FLIGHT', True):
+            self.assertEqual(str(AnyUrlValue.from_model(page)), '/single/')
+        self.assertIsNone(cache.get(get_urlfield_cache_key(RegPageModel, page.pk) + '.lease'))
@@ -1,14 +1,20 @@
+from unittest import mock
+
 import django
 from django import forms
+from django.core.cache import cache
+from django.http import HttpResponse
 from django.template import Context, Template
-from django.test import TestCase
+from django.test import RequestFactory, TestCase
 
 import any_urlfield.forms
+from any_urlfield.cache import get_urlfield_cache_key
 from any_urlfield.forms import SimpleRawIdWidget
+from any_urlfield.forms.widgets import SharedChoicesMiddleware, _shared_choices
 from any_urlfield.models import AnyUrlValue
 from any_urlfield.models.values import ResolvedTypeValue
 from any_urlfield.registry import UrlTypeRegistry
-from any_urlfield.tests import PageModel, RegPageModel, UrlModel
+from any_urlfield.tests import LinkListModel, PageModel, RegPageModel, UrlModel
 from any_urlfield.tests.utils import get_input_values
 
 
@@ -46,7 +52,8 @@ class FormTests(TestCase):
         })
         self.assertTrue(form.is_valid())
         self.assertEqual(form.cleaned_data['url'].to_db_value(), 'any_urlfield.pagemodel://{}'.format(x.pk))
-        self.assertEqual(form.cleaned_data['url'].get_object(), x)
+        with self.assertNumQueries(0):
+            self.assertEqual(form.cleaned_data['url'].get_object(), x)  # Reused from the form field.
 
         expected = AnyUrlValue.from_db_value('any_urlfield.pagemodel://{}'.format(x.pk), url_type_registry=reg)
         self.assertEqual(form.cleaned_data['url'], expected)
@@ -224,3 +231,270 @@ class FormTests(TestCase):
             'rad': "1",
             'chk': "yes",
         })
+
+    def test_form_prototype(self):
+        """
+        The form fields of the URL types are built once per registry, until a new type is registered.
+        A form field instance is copied by each form.
+        """
+        reg = UrlTypeRegistry()
+        form_field = forms.ModelChoiceField(queryset=PageModel.objects.all())
+        reg.register(PageModel, form_field=form_field)
+
+        prototype = reg.get_form_prototype()
+        field1 = any_urlfield.forms.AnyUrlField(url_type_registry=reg)
+        field2 = any_urlfield.forms.AnyUrlField(url_type_registry=reg)
+        self.assertIs(reg.get_form_prototype(), prototype)
+        self.assertIsNot(field1.fields[2], form_field)
+        self.assertIsNot(field1.fields[2], field2.fields[2])
+        self.assertIsNot(field1.widget.widgets[2], field2.widget.widgets[2])
+
+        reg.register(RegPageModel)
+        self.assertIsNot(reg.get_form_prototype(), prototype)
+        self.assertEqual(len(any_urlfield.forms.AnyUrlField(url_type_registry=reg).fields), 4)
+
+    def test_form_prototype_callable(self):
+        """
+        A form_field callable is called for each form, as it may compute values (e.g. labels, filters).
+        """
+        reg = UrlTypeRegistry()
+        form_field = mock.Mock(side_effect=lambda: forms.ModelChoiceField(queryset=PageModel.objects.all()))
+        reg.register(PageModel, form_field=form_field)
+        reg.get_form_prototype()
+
+        field1 = any_urlfield.forms.AnyUrlField(url_type_registry=reg)
+        field2 = any_urlfield.forms.AnyUrlField(url_type_registry=reg)
+        self.assertEqual(form_field.call_count, 3)
+        self.assertIs(field1.widget.widgets[2], field1.fields[2].widget)
+        self.assertIsNot(field1.widget.widgets[2], field2.widget.widgets[2])
+
+    def test_form_prototype_prefetch_related(self):
+        """
+        The choices of a shared queryset with prefetch_related() are evaluated for each form.
+        """
+        reg = UrlTypeRegistry()
+        reg.register(LinkListModel, form_field=forms.ModelChoiceField(
+            queryset=LinkListModel.objects.prefetch_related('links')
+        ))
+        link_list1 = LinkListModel.objects.create(title='first')
+        html = any_urlfield.forms.AnyUrlField(url_type_registry=reg).widget.render('url', None)
+        self.assertIn('value="{}"'.format(link_list1.pk), html)
+
+        link_list2 = LinkListModel.objects.create(title='second')
+        html = any_urlfield.forms.AnyUrlField(url_type_registry=reg).widget.render('url', None)
+        self.assertIn('value="{}"'.format(link_list2.pk), html)
+        html = any_urlfield.forms.AnyUrlWidget(url_type_registry=reg).render('url', None)
+        self.assertIn('value="{}"'.format(link_list2.pk), html)
+
+    def test_shared_choices(self):
+        """
+        The choices are evaluated and rendered once for all forms in a formset.
+        """
+        reg = UrlTypeRegistry()
+        reg.register(PageModel)
+        reg.register(RegPageModel)
+        pages = [PageModel.objects.create(slug='shared{}'.format(i)) for i in range(3)]
+        RegPageModel.objects.create(slug='shared')
+
+        class ExampleForm(forms.Form):
+            url = any_urlfield.forms.AnyUrlField(url_type_registry=reg)
+
+        ExampleFormSet = forms.formset_factory(ExampleForm, extra=0)
+        initial = [{'url': AnyUrlValue.from_model(page, reg)} for page in pages] + [{}]
+
+        # The URLs are rendered as value of the widget, avoid sharing them with other tests.
+        cache_keys = [get_urlfield_cache_key(PageModel, page.pk) for page in pages]
+        cache.delete_many(cache_keys)
+        self.addCleanup(cache.delete_many, cache_keys)
+        AnyUrlValue.render_urls([row['url'] for row in initial[:-1]])
+
+        with self.assertNumQueries(2 * len(initial)):
+            expected = ExampleFormSet(initial=initial).as_p()
+
+        with self.assertNumQueries(2), any_urlfield.forms.shared_choices():
+            html = ExampleFormSet(initial=initial).as_p()
+        self.assertHTMLEqual(html, expected)
+        self.assertIn('<option value="{}" selected>shared1</option>'.format(pages[1].pk), html)
+
+    def test_shared_choices_to_field_name(self):
+        """
+        The choices are only shared by fields that use the same option values.
+        """
+        reg = UrlTypeRegistry()
+        reg.register(PageModel)
+        reg2 = UrlTypeRegistry()
+        reg2.register(PageModel, form_field=forms.ModelChoiceField(queryset=PageModel.objects.all(), to_field_name='slug'))
+        page = PageModel.objects.create(slug='shared')
+
+        class ExampleForm(forms.Form):
+            url = any_urlfield.forms.AnyUrlField(url_type_registry=reg)
+            url2 = any_urlfield.forms.AnyUrlField(url_type_registry=reg2)
+
+        with any_urlfield.forms.shared_choices():
+            html = ExampleForm().as_p()
+        self.assertInHTML('<option value="{}">shared</option>'.format(page.pk), html)
+        self.assertInHTML('<option value="shared">shared</option>', html)
+
+    def test_shared_choices_empty_queryset(self):
+        """
+        A queryset that can't return objects is not shared, as its query can't be printed.
+        """
+        reg = UrlTypeRegistry()
+        reg.register(PageModel, form_field=lambda: forms.ModelChoiceField(queryset=PageModel.objects.none()))
+
+        class ExampleForm(forms.Form):
+            url = any_urlfield.forms.AnyUrlField(url_type_registry=reg)
+
+        with any_urlfield.forms.shared_choices():
+            html = ExampleForm().as_p()
+        self.assertInHTML('<option value="" selected>---------</option>', html)
+
+    def test_shared_choices_middleware(self):
+        def _view(request):
+            return HttpResponse(str(_shared_choices.get() is not None))
+
+        request = RequestFactory().get('/')
+        self.assertEqual(SharedChoicesMiddleware(_view)(request).content, b'True')
+        self.assertIsNone(_shared_choices.get())
+        self.assertTrue(SharedChoicesMiddleware.async_capable)
+
+    def test_search_select_widget(self):
+        """
+        The search widget only renders the selected object.
+        """
+        reg = UrlTypeRegistry()
+        reg.register(PageModel, widget=any_urlfield.forms.SearchSelectWidget(search_fields=('^slug',)))
+        pages = [PageModel.objects.create(slug='search{}'.format(i)) for i in range(3)]
+
+        class ExampleForm(forms.Form):
+            url = any_urlfield.forms.AnyUrlField(url_type_registry=reg)
+
+        value = AnyUrlValue.from_model(pages[1], reg)
+        with self.assertNumQueries(1):
+            html = ExampleForm(initial={'url': value}).as_p()
+        self.assertIn('data-ajax--url="/any_urlfield/search/any_urlfield/pagemodel/"', html)
+        self.assertIn('<option value="{}" selected>search1</option>'.format(pages[1].pk), html)
+        self.assertNotIn('search0', html)
+
+        # The object of a resolved value is reused.
+        value._set_resolved_objects({pages[1].pk: pages[1]})
+        with self.assertNumQueries(0):
+            html = ExampleForm(initial={'url': value}).as_p()
+        self.assertIn('<option value="{}" selected>search1</option>'.format(pages[1].pk), html)
+
+        # Submitted values are still validated.
+        form = ExampleForm(data={'url_0': 'any_urlfield.pagemodel', 'url_1': '', 'url_2': str(pages[2].pk)})
+        self.assertTrue(form.is_valid())
+        self.assertEqual(form.cleaned_data['url'].type_value, pages[2].pk)
+
+    def test_lazy_widget(self):
+        """
+        The lazy widget only renders the subwidget of the selected type.
+        """
+        class UrlModelForm(forms.ModelForm):
+            class Meta:
+                model = UrlModel
+                fields = ('url',)
+
+        form = UrlModelForm(initial={'url': AnyUrlValue.from_db_value('http://example.org/')})
+        form.fields['url'].widget.lazy = True
+        with self.assertNumQueries(0):
+            html = str(form['url'])
+        self.assertIn('value="http://example.org/"', html)
+        self.assertIn('<span class="any_urlfield-placeholder" data-url="/any_urlfield/widget/any_urlfield.regpagemodel/', html)
+        self.assertNotIn('vForeignKeyRawIdAdminField', html)
+
+        # Subwidgets with a submitted value are also rendered.
+        with mock.patch('any_urlfield.appsettings.ANY_URLFIELD_LAZY_WIDGET', True):
+            form = UrlModelForm(data={'url_0': 'any_urlfield.regpagemodel', 'url_1': 'http://example.org/', 'url_2': ''})
+            html = str(form['url'])
+        self.assertIn('value="http://example.org/"', html)
+        self.assertIn('name="url_2"', html)
+
+    def test_lazy_widget_registry(self):
+        """
+        The view can't render the widgets of other registries, so these are always rendered.
+        """
+        reg = UrlTypeRegistry()
+        reg.register(PageModel)
+
+        class ExampleForm(forms.Form):
+            url = any_urlfield.forms.AnyUrlField(url_type_registry=reg)
+
+        form = ExampleForm(initial={'url': AnyUrlValue.from_db_value('http://example.org/', reg)})
+        form.fields['url'].widget.lazy = True
+        html = str(form['url'])
+        self.assertIn('<select name="url_2"', html)
+        self.assertNotIn('any_urlfield-placeholder', html)
+
+    def test_prefetch_raw_id_objects(self):
+        """
+        The raw ID widgets of a formset are rendered with a single query.
+        """
+        reg = UrlTypeRegistry()
+        reg.register(PageModel, widget=SimpleRawIdWidget(PageModel))
+        pages = [PageModel.objects.create(slug='raw{}'.format(i)) for i in range(10)]
+
+        class ExampleForm(forms.Form):
+            url = any_urlfield.forms.AnyUrlField(url_type_registry=reg)
+
+        ExampleFormSet = forms.formset_factory(ExampleForm, extra=0)
+        formset = ExampleFormSet(initial=[{'url': AnyUrlValue('any_urlfield.pagemodel', page.pk, reg)} for page in pages])
+        with self.assertNumQueries(1):
+            any_urlfield.forms.prefetch_raw_id_objects(formset.forms)
+
+        # The URLs are rendered as value of the widget, avoid sharing them with other tests.
+        cache_keys = [get_urlfield_cache_key(PageModel, page.pk) for page in pages]
+        cache.delete_many(cache_keys)
+        self.addCleanup(cache.delete_many, cache_keys)
+        AnyUrlValue.render_urls([form.initial['url'] for form in formset.forms])
+
+        with self.assertNumQueries(0):
+            html = formset.as_p()
+        self.assertIn('<strong>raw3</strong>', html)  # PageModel has no admin.
+
+    def test_prefetch_raw_id_objects_data(self):
+        """
+        Submitted values are fetched too, including the change URL in the admin.
+        """
+        reg = UrlTypeRegistry()
+        reg.register(RegPageModel, widget=SimpleRawIdWidget(RegPageModel))
+        pages = [RegPageModel.objects.create(slug='raw{}'.format(i)) for i in range(3)]
+
+        class ExampleForm(forms.Form):
+            url = any_urlfield.forms.AnyUrlField(url_type_registry=reg)
+
+        ExampleFormSet = forms.formset_factory(ExampleForm)
+        data = {'form-TOTAL_FORMS': '3', 'form-INITIAL_FORMS': '0'}
+        for i, pk in enumerate([pages[1].pk, pages[2].pk, 999999]):
+            data.update({'form-{}-url_0'.format(i): 'any_urlfield.regpagemodel', 'form-{}-url_2'.format(i): str(pk)})
+
+        formset = ExampleFormSet(data=data)
+        with self.assertNumQueries(1):
+            any_urlfield.forms.prefetch_raw_id_objects(formset.forms)
+        with self.assertNumQueries(0):
+            html = ''.join(str(form['url']) for form in formset.forms)
+        self.assertIn('<a href="/admin/any_urlfield/regpagemodel/{}/change/">raw2</a>'.format(pages[2].pk), html)
+        self.assertNotIn('999999/change/', html)
+
+    def test_admin_mixin(self):
+        """
+        The admin mixin prefetches the objects of the change form and its inlines.
+        """
+        from any_urlfield.admin import AnyUrlFieldAdminMixin
+
+        class BaseAdmin:
+            def render_change_form(self, request, context, *args, **kwargs):
+                return context
+
+        class ExampleAdmin(AnyUrlFieldAdminMixin, BaseAdmin):
+            pass
+
+        form = mock.Mock()
+        inline_admin_formset = mock.Mock()
+        inline_admin_formset.formset.forms = [mock.Mock(), mock.Mock()]
+        context = {'adminform': mock.Mock(form=form), 'inline_admin_formsets': [inline_admin_formset]}
+
+        with mock.patch('any_urlfield.admin.prefetch_raw_id_objects') as mock_prefetch:
+            ExampleAdmin().render_change_form(None, context)
+        mock_prefetch.assert_called_once_with([form] + inline_admin_formset.formset.forms)
@@ -0,0 +1,90 @@
+import asyncio
+from unittest import mock, skipIf
+
+import django
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase
+
+from any_urlfield.cache import get_urlfield_cache_key
+from any_urlfield.loader import UrlLoaderMiddleware, _current_loader, url_loader
+from any_urlfield.models import AnyUrlValue
+from any_urlfield.registry import UrlTypeRegistry
+from any_urlfield.tests import PageModel
+
+
+class UrlLoaderTests(TestCase):
+    """
+    Test the request scoped URL loader.
+    """
+
+    def setUp(self):
+        self.reg = UrlTypeRegistry()
+        self.urltype = self.reg.register(PageModel)
+        self.pages = [PageModel.objects.create(slug='load{}'.format(i)) for i in range(3)]
+
+        # Avoid sharing cached URLs with other tests, these use the same ID's.
+        cache_keys = [get_urlfield_cache_key(PageModel, page.pk) for page in self.pages]
+        cache.delete_many(cache_keys)
+        self.addCleanup(cache.delete_many, cache_keys)
+
+    def _get_value(self, page):
+        return AnyUrlValue(self.urltype.prefix, page.pk, self.reg)
+
+    def test_load_url(self):
+        """
+        All queued values are rendered at once, equal values are only rendered once.
+        """
+        with url_loader():
+            urls = [self._get_value(page).load_url() for page in self.pages + self.pages]
+            urls.append(AnyUrlValue.from_db_value('http://example.org/').load_url())
+
+            with mock.patch.object(AnyUrlValue, 'render_urls', wraps=AnyUrlValue.render_urls) as mock_render_urls, \
+                    self.assertNumQueries(1):
+                self.assertEqual(str(urls[0]), '/load0/')
+                self.assertEqual([str(url) for url in urls], ['/load0/', '/load1/', '/load2/'] * 2 + ['http://example.org/'])
+            self.assertEqual(mock_render_urls.call_count, 1)
+            self.assertEqual(len(mock_render_urls.call_args.args[0]), 3)
+
+            # Later values in the same request reuse the URLs.
+            with mock.patch.object(AnyUrlValue, 'render_urls') as mock_render_urls:
+                self.assertEqual(str(self._get_value(self.pages[1]).load_url()), '/load1/')
+            mock_render_urls.assert_not_called()
+
+    def test_load_url_without_loader(self):
+        self.assertIsNone(_current_loader.get())
+        self.assertEqual(str(self._get_value(self.pages[0]).load_url()), '/load0/')
+
+    @skipIf(django.VERSION < (3, 1), "Async test methods require Django 3.1")
+    async def test_await(self):
+        """
+        Awaiting the URLs lets other tasks queue their values first.
+        """
+        async def _load(page):
+            return await self._get_value(page).load_url()
+
+        with url_loader(), \
+                mock.patch.object(AnyUrlValue, 'arender_urls', wraps=AnyUrlValue.arender_urls) as mock_arender_urls:
+            urls = await asyncio.gather(*(_load(page) for page in self.pages))
+        self.assertEqual(urls, ['/load0/', '/load1/', '/load2/'])
+        self.assertEqual(mock_arender_urls.call_count, 1)
+
+    def test_middleware(self):
+        def _view(request):
+            return HttpResponse(str(_current_loader.get() is not None))
+
+        request = RequestFactory().get('/')
+        self.assertEqual(UrlLoaderMiddleware(_view)(request).content, b'True')
+        self.assertIsNone(_current_loader.get())
+
+    @skipIf(django.VERSION < (3, 0), "Async views require Django 3.0")
+    def test_async_middleware(self):
+        from asgiref.sync import async_to_sync
+
+        async def _view(request):
+            return HttpResponse(str(_current_loader.get() is not None))
+
+        middleware = UrlLoaderMiddleware(_view)
+        self.assertTrue(asyncio.iscoroutinefunction(middleware))
+        request = RequestFactory().get('/')
+        self.assertEqual(async_to_sync(middleware)(request).content, b'True')
@@ -1,8 +1,16 @@
+import threading
+from unittest import mock, skipIf
+
+import django
+from django.core.cache import cache, caches
+from django.core.exceptions import ValidationError
+from django.db.models import Prefetch
 from django.test import TestCase
 
+from any_urlfield.cache import get_urlfield_cache_key, url_cache
 from any_urlfield.models import AnyUrlField, AnyUrlValue
 from any_urlfield.registry import UrlTypeRegistry
-from any_urlfield.tests import PageModel, RegPageModel, UrlModel
+from any_urlfield.tests import AutoResolveUrlModel, LazyUrlModel, LinkListModel, LinkModel, PageModel, RegPageModel, UrlModel
 
 
 class ModelTests(TestCase):
@@ -16,6 +24,37 @@ class ModelTests(TestCase):
         self.assertIsNotNone(reg['http'])
         self.assertIsNotNone(reg['https'])
 
+    def test_registry_lookups(self):
+        """
+        Test the prefix and model dispatch tables.
+        """
+        reg = UrlTypeRegistry()
+        urltype = reg.register(PageModel)
+
+        self.assertIs(reg['any_urlfield.pagemodel'], urltype)
+        self.assertEqual(reg.index('any_urlfield.pagemodel'), 1)
+        self.assertIs(reg['mailto'], reg['http'])
+        self.assertEqual(reg.index('mailto'), 0)
+        self.assertIsNone(reg['unknown'])
+        self.assertIsNone(reg.index('unknown'))
+        self.assertIs(reg.get_for_model(PageModel), urltype)
+        self.assertIsNone(reg.get_for_model(RegPageModel))
+        self.assertEqual(reg.keys(), ['http', 'any_urlfield.pagemodel'])
+        self.assertRaises(ValueError, lambda: reg.register(PageModel))
+
+    def test_registry_freeze(self):
+        """
+        A frozen registry still dispatches, but refuses new registrations.
+        """
+        reg = UrlTypeRegistry()
+        urltype = reg.register(PageModel)
+        reg.freeze()
+
+        self.assertTrue(reg.is_frozen)
+        self.assertIs(reg['any_urlfield.pagemodel'], urltype)
+        self.assertIs(reg.get_for_model(PageModel), urltype)
+        self.assertRaises(RuntimeError, lambda: reg.register(RegPageModel))
+
     def test_from_model(self):
         """
         Basic test of ``from_model``.
@@ -71,6 +110,47 @@ class ModelTests(TestCase):
         self.assertEqual(v.type_value, "mailto://test@example.com")
         self.assertEqual(str(v), "mailto://test@example.com")
 
+    def test_from_db_value_parse_cache(self):
+        """
+        Repeated database values are parsed once, but each give a new object.
+        """
+        reg = UrlTypeRegistry()
+        reg.register(PageModel)
+
+        v1 = AnyUrlValue.from_db_value("any_urlfield.pagemodel://12", reg)
+        v2 = AnyUrlValue.from_db_value("any_urlfield.pagemodel://12", reg)
+        self.assertIsNot(v1, v2)
+        self.assertEqual(v1, v2)
+        self.assertEqual(v2.type_value, 12)
+        self.assertIsNone(AnyUrlValue.from_db_value("any_urlfield.pagemodel://None", reg))
+
+        info = reg.parse_cache_info()
+        self.assertEqual(info.hits, 1)
+        self.assertEqual(info.misses, 2)
+        self.assertRaises(ValueError, lambda: AnyUrlValue.from_db_value("unknown.model://1", reg))
+
+    def test_hash(self):
+        """
+        Equal values have an equal hash, so they can be used in sets.
+        """
+        reg = UrlTypeRegistry()
+        urltype = reg.register(PageModel)
+
+        v1 = AnyUrlValue(urltype.prefix, 12, reg)
+        v2 = AnyUrlValue.from_db_value("any_urlfield.pagemodel://12", reg)
+        v3 = AnyUrlValue.from_db_value("http://www.example.com/", reg)
+        self.assertEqual(hash(v1), hash(v2))
+        self.assertEqual(len({v1, v2, v3}), 2)
+
+    def test_slots(self):
+        """
+        Values don't allocate a ``__dict__`` per instance.
+        """
+        v = AnyUrlValue.from_db_value("http://www.example.com/")
+        self.assertFalse(hasattr(v, '__dict__'))
+        self.assertIsNone(v._url_cache)
+        self.assertRaises(AttributeError, lambda: v._unknown)
+
     def test_valid_db_id(self):
         """
         Make sure ID values are properly stored and serialized.
@@ -164,6 +244,100 @@ class ModelTests(TestCase):
             self.assertRaises(PageModel.DoesNotExist, lambda: invalid.get_object())
             self.assertFalse(invalid.exists())
 
+    def test_validate_many(self):
+        """
+        The objects of many values are checked at once, and reused by the field validation.
+        """
+        page1 = RegPageModel.objects.create(slug='valid1')
+        page2 = RegPageModel.objects.create(slug='valid2')
+        values = [
+            AnyUrlValue.from_model(page1),
+            AnyUrlValue.from_model(page2),
+            AnyUrlValue.from_db_value('any_urlfield.regpagemodel://999999'),
+            AnyUrlValue.from_db_value('http://www.example.org/'),
+            None,
+        ]
+
+        with self.assertNumQueries(1):
+            self.assertEqual(AnyUrlField.validate_many(values), [values[2]])
+
+        field = UrlModel._meta.get_field('url')
+        with self.assertNumQueries(0):
+            field.validate(values[0], None)
+            self.assertRaises(ValidationError, field.validate, values[2], None)
+
+    def test_render_urls(self):
+        """
+        URLs can be generated in bulk, with a single cache read.
+        """
+        reg = UrlTypeRegistry()
+        urltype = reg.register(PageModel)
+        page1 = PageModel.objects.create(slug='render1')
+        page2 = PageModel.objects.create(slug='render2')
+
+        # Avoid sharing cached URLs with other tests, these use the same ID's.
+        cache_keys = [get_urlfield_cache_key(PageModel, pk) for pk in (page1.pk, page2.pk, 999999)]
+        cache.delete_many(cache_keys)
+        self.addCleanup(cache.delete_many, cache_keys)
+
+        def _get_values():
+            return [
+                AnyUrlValue(urltype.prefix, page1.id, reg),
+                AnyUrlValue(urltype.prefix, page2.id, reg),
+                AnyUrlValue(urltype.prefix, page1.id, reg),
+                AnyUrlValue(urltype.prefix, 999999, reg),
+                AnyUrlValue.from_db_value('http://www.example.org/', reg),
+                None,
+            ]
+
+        expected = ['/render1/', '/render2/', '/render1/', '#DoesNotExist', 'http://www.example.org/', '']
+        values = _get_values()
+        with self.assertNumQueries(1):
+            self.assertEqual(AnyUrlValue.render_urls(values), expected)
+
+        # The URLs are stored in the values
+        with mock.patch('any_urlfield.models.values.get_url_cache') as mock_get_cache:
+            self.assertEqual([str(v) if v is not None else '' for v in values], expected)
+        self.assertEqual(mock_get_cache.mock_calls, [])
+
+        # New values read the cache in a single call, the missing object is cached too.
+        values = _get_values()
+        with self.assertNumQueries(0), mock.patch.object(url_cache, 'get_many', wraps=url_cache.get_many) as mock_get_many:
+            self.assertEqual(AnyUrlValue.render_urls(values), expected)
+        self.assertEqual(mock_get_many.call_count, 1)
+
+    def test_url_memoization(self):
+        """
+        The URL is generated once per value, until the value changes.
+        """
+        reg = UrlTypeRegistry()
+        urltype = reg.register(PageModel)
+        page1 = PageModel.objects.create(slug='memo1')
+        page2 = PageModel.objects.create(slug='memo2')
+
+        cache_keys = [get_urlfield_cache_key(PageModel, page.pk) for page in (page1, page2)]
+        cache.delete_many(cache_keys)
+        self.addCleanup(cache.delete_many, cache_keys)
+
+        v = AnyUrlValue(urltype.prefix, page1.pk, reg)
+        with self.assertNumQueries(1), mock.patch.object(url_cache, 'get_many', wraps=url_cache.get_many) as mock_get_many:
+            self.assertEqual(str(v), '/memo1/')
+            self.assertEqual(len(v), 7)
+            self.assertTrue(v.startswith('/memo'))
+        self.assertEqual(mock_get_many.call_count, 1)
+
+        # Changing the value invalidates the URL and object.
+        v.type_value = page2.pk
+        self.assertIsNone(v._resolved_objects)
+        with self.assertNumQueries(1):
+            self.assertEqual(str(v), '/memo2/')
+
+        # Resolving the object again invalidates the URL.
+        page2.slug = 'memo3'
+        v._set_resolved_objects({page2.pk: page2})
+        self.assertEqual(v.get_object(), page2)
+        self.assertIsNone(v._url_cache)
+
     def test_resolve_objects(self):
         """
         Make sure ID values are properly stored and serialized.
@@ -183,3 +357,179 @@ class ModelTests(TestCase):
                 self.assertEqual(str(obj.url), '/modelform/')
                 self.assertTrue(obj.url.exists())
                 self.assertEqual(obj.url.get_object(), page3)
+
+    def test_prefetch_anyurls(self):
+        """
+        The queryset resolves the values when it's evaluated.
+        """
+        page1 = RegPageModel.objects.create(slug='prefetch1')
+        page2 = RegPageModel.objects.create(slug='prefetch2')
+        parent = LinkListModel.objects.create(title='links')
+        LinkModel.objects.create(parent=parent, url=AnyUrlValue.from_model(page1))
+        LinkModel.objects.create(parent=parent, url=AnyUrlValue.from_model(page2))
+        LinkModel.objects.create(parent=parent, url=AnyUrlValue.from_db_value('http://www.example.org/'))
+
+        with self.assertNumQueries(2):
+            links = list(LinkModel.objects.prefetch_anyurls('url').order_by('pk'))
+            self.assertEqual(links[0].url.get_object(), page1)
+            self.assertEqual(links[1].url.get_object(), page2)
+
+        # Cloning keeps the setting, None clears it.
+        qs = LinkModel.objects.prefetch_anyurls().filter(parent=parent)
+        self.assertTrue(all(link.url._resolved_objects is not None for link in qs if link.url.type_prefix != 'http'))
+        self.assertIsNone(qs.prefetch_anyurls(None).first().url._resolved_objects)
+
+        # values() querysets are ignored.
+        self.assertEqual(len(LinkModel.objects.prefetch_anyurls().values('url')), 3)
+
+    def test_prefetch_anyurls_related(self):
+        """
+        The values can be resolved via a Prefetch object or a related lookup.
+        """
+        page1 = RegPageModel.objects.create(slug='prefetch1')
+        page2 = RegPageModel.objects.create(slug='prefetch2')
+        for title, page in (('a', page1), ('b', page2)):
+            parent = LinkListModel.objects.create(title=title)
+            LinkModel.objects.create(parent=parent, url=AnyUrlValue.from_model(page))
+
+        with self.assertNumQueries(3):
+            parents = list(LinkListModel.objects.prefetch_related(
+                Prefetch('links', queryset=LinkModel.objects.prefetch_anyurls('url'))
+            ))
+            self.assertEqual([p.links.all()[0].url.get_object() for p in parents], [page1, page2])
+
+        with self.assertNumQueries(3):
+            parents = LinkListModel.objects.prefetch_related('links')
+            AnyUrlField.resolve_objects(parents, fields=['links__url'])
+            self.assertEqual([p.links.all()[0].url.get_object() for p in parents], [page1, page2])
+
+    def test_auto_resolve(self):
+        """
+        Values of the same query are resolved together on first access.
+        """
+        pages = [RegPageModel.objects.create(slug='auto{}'.format(i)) for i in range(3)]
+        for page in pages:
+            AutoResolveUrlModel.objects.create(url=AnyUrlValue.from_model(page))
+        AutoResolveUrlModel.objects.create(url=AnyUrlValue.from_db_value('http://www.example.org/'))
+
+        objects = list(AutoResolveUrlModel.objects.order_by('pk'))
+        other = AutoResolveUrlModel.objects.order_by('pk').first()
+        with self.assertNumQueries(1):
+            self.assertEqual([obj.url.get_object() for obj in objects[:3]], pages)
+            self.assertTrue(objects[2].url.exists())
+
+        # Values of another query are not part of the batch.
+        self.assertIsNone(other.url._resolved_objects)
+        with self.assertNumQueries(1):
+            self.assertEqual(other.url.get_object(), pages[0])
+
+    def test_lazy_field(self):
+        """
+        Lazy fields only parse the database value on first access.
+        """
+        page = RegPageModel.objects.create(slug='lazy')
+        LazyUrlModel.objects.create(url=AnyUrlValue.from_model(page))
+
+        obj = LazyUrlModel.objects.get()
+        self.assertEqual(obj.__dict__['url'], 'any_urlfield.regpagemodel://{}'.format(page.pk))
+
+        # Saving writes the raw value back
+        obj.save()
+        self.assertIsInstance(obj.__dict__['url'], str)
+        self.assertEqual(LazyUrlModel.objects.filter(url=obj.__dict__['url']).count(), 1)
+
+        # Reading parses the value once
+        value = obj.url
+        self.assertIsInstance(value, AnyUrlValue)
+        self.assertIs(obj.url, value)
+        self.assertEqual(value.get_object(), page)
+
+    def test_lazy_field_deferred(self):
+        """
+        Deferred lazy fields are fetched and parsed on access.
+        """
+        LazyUrlModel.objects.create(url=AnyUrlValue.from_db_value('http://www.example.org/'))
+        obj = LazyUrlModel.objects.defer('url').get()
+        self.assertEqual(obj.url, AnyUrlValue.from_db_value('http://www.example.org/'))
+
+
+@skipIf(django.VERSION < (3, 1), "Async test methods require Django 3.1")
+class AsyncValueTests(TestCase):
+    """
+    Test the async API of the values.
+    """
+
+    def setUp(self):
+        self.reg = UrlTypeRegistry()
+        self.urltype = self.reg.register(PageModel)
+
+    async def _create_value(self, slug):
+        from asgiref.sync import sync_to_async
+        page = await sync_to_async(PageModel.objects.create)(slug=slug)
+
+        # Avoid sharing cached URLs with other tests, these use the same ID's.
+        cache_key = get_urlfield_cache_key(PageModel, page.pk)
+        cache.delete(cache_key)
+        self.addCleanup(cache.delete, cache_key)
+        return page, AnyUrlValue(self.urltype.prefix, page.pk, self.reg)
+
+    async def test_aget_object(self):
+        page, value = await self._create_value('async')
+        self.assertEqual(await value.aget_object(), page)
+        self.assertEqual(value.get_object(), page)  # Remembered
+
+        invalid = AnyUrlValue(self.urltype.prefix, 999999, self.reg)
+        with self.assertRaises(PageModel.DoesNotExist):
+            await invalid.aget_object()
+
+    async def test_aurl(self):
+        page, value = await self._create_value('async')
+        self.assertEqual(await value.aurl(), '/async/')
+        self.assertEqual(await AnyUrlValue.from_db_value('http://example.org/').aurl(), 'http://example.org/')
+
+        # Read from the cache
+        value = AnyUrlValue(self.urltype.prefix, page.pk, self.reg)
+        with mock.patch.object(PageModel.objects, 'in_bulk') as mock_in_bulk:
+            self.assertEqual(await value.aurl(), '/async/')
+        mock_in_bulk.assert_not_called()
+
+    async def test_aresolve_values(self):
+        page1, value1 = await self._create_value('async1')
+        page2, value2 = await self._create_value('async2')
+        values = [value1, value2, AnyUrlValue.from_db_value('http://example.org/'), None]
+
+        await AnyUrlValue.aresolve_values(values)
+        self.assertEqual(value1._resolved_objects, {page1.pk: page1, page2.pk: page2})
+        self.assertEqual(await AnyUrlValue.arender_urls(values), ['/async1/', '/async2/', 'http://example.org/', ''])
+
+    async def test_arender_urls_async_cache(self):
+        """
+        The async methods of the cache backend are used when Django provides them.
+        """
+        page, value = await self._create_value('async')
+        backend = caches['default']
+        with mock.patch.object(backend, 'aget_many', mock.AsyncMock(return_value={}), create=True) as mock_aget_many, \
+                mock.patch.object(backend, 'aset_many', mock.AsyncMock(), create=True) as mock_aset_many, \
+                mock.patch.object(backend, 'get_many') as mock_get_many:
+            self.assertEqual(await AnyUrlValue.arender_urls([value]), ['/async/'])
+        mock_aget_many.assert_awaited_once_with({get_urlfield_cache_key(PageModel, page.pk)})
+        mock_aset_many.assert_awaited_once()
+        mock_get_many.assert_not_called()
+
+    async def test_arender_urls_generation(self):
+        """
+        The generation is read from the cache outside the event loop.
+        """
+        page, value = await self._create_value('async')
+        threads = []
+
+        def _get_cache_generation(model, cache_alias=None):
+            threads.append(threading.get_ident())
+            return 1
+
+        with mock.patch('any_urlfield.appsettings.ANY_URLFIELD_CACHE_INVALIDATION', 'generation'), \
+                mock.patch('any_urlfield.cache.get_cache_generation', side_effect=_get_cache_generation), \
+                mock.patch.object(caches['default'], 'set_many'):
+            self.assertEqual(await AnyUrlValue.arender_urls([value]), ['/async/'])
+        self.assertTrue(threads)
+        self.assertNotIn(threading.get_ident(), threads)
@@ -48,3 +48,17 @@ class PickleTests(TestCase):
         # See that the object still works properly
         self.assertEqual(v2.get_object(), page)
         self.assertEqual(str(v2), '/foo/')
+
+    def test_pickle_frozen_registry(self):
+        """
+        Frozen registries rebuild their dispatch tables when unpickled.
+        """
+        reg = UrlTypeRegistry()
+        urltype = reg.register(PageModel)
+        reg.freeze()
+
+        reg2 = pickle.loads(pickle.dumps(reg))
+        self.assertEqual(reg, reg2)
+        self.assertTrue(reg2.is_frozen)
+        self.assertEqual(reg2[urltype.prefix], urltype)
+        self.assertEqual(reg2.index(urltype.prefix), 1)
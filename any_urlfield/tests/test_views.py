@@ -0,0 +1,140 @@
+import json
+import re
+from html import unescape
+from unittest import mock
+from urllib.parse import urlencode
+
+from django import forms
+from django.contrib.auth.models import AnonymousUser, Permission, User
+from django.core.exceptions import ImproperlyConfigured, PermissionDenied
+from django.http import Http404
+from django.test import RequestFactory, TestCase
+
+from any_urlfield.forms import SearchSelectWidget
+from any_urlfield.models import AnyUrlValue
+from any_urlfield.registry import UrlTypeRegistry
+from any_urlfield.tests import PageModel, RegPageModel, UrlModel
+from any_urlfield.views import render_widget, search
+
+
+class SearchViewTests(TestCase):
+    """
+    Test the JSON view of the search widget.
+    """
+
+    def setUp(self):
+        self.reg = UrlTypeRegistry()
+        self.reg.register(PageModel, widget=SearchSelectWidget(search_fields=('^slug',), page_size=2))
+        self.reg.register(RegPageModel)
+        self.pages = [PageModel.objects.create(slug=slug) for slug in ('apple', 'apricot', 'avocado', 'banana')]
+
+        self.user = User.objects.create_user('staff', is_staff=True)
+        self.user.user_permissions.add(Permission.objects.get(codename='view_pagemodel'))
+
+    def _search(self, model_name='pagemodel', user=None, **params):
+        request = RequestFactory().get('/', params)
+        request.user = user or self.user
+        return search(request, 'any_urlfield', model_name, url_type_registry=self.reg)
+
+    def test_search(self):
+        response = self._search(term='ap')
+        self.assertEqual(json.loads(response.content.decode()), {
+            'results': [
+                {'id': str(self.pages[0].pk), 'text': 'apple'},
+                {'id': str(self.pages[1].pk), 'text': 'apricot'},
+            ],
+            'pagination': {'more': False},
+        })
+
+    def test_pagination(self):
+        data = json.loads(self._search(term='a').content.decode())
+        self.assertEqual([row['text'] for row in data['results']], ['apple', 'apricot'])
+        self.assertTrue(data['pagination']['more'])
+
+        # No COUNT query, the permissions are already loaded.
+        # The widget of the registry prototype is copied, so the search fields are not validated again.
+        with self.assertNumQueries(1), \
+                mock.patch.object(SearchSelectWidget, '__init__', side_effect=AssertionError) as mock_init:
+            data = json.loads(self._search(term='a', page='2').content.decode())
+        mock_init.assert_not_called()
+        self.assertEqual([row['text'] for row in data['results']], ['avocado'])
+        self.assertFalse(data['pagination']['more'])
+
+    def test_permissions(self):
+        with self.assertRaises(PermissionDenied):
+            self._search(user=AnonymousUser())
+
+        self.user.user_permissions.clear()
+        with self.assertRaises(PermissionDenied):
+            self._search(user=User.objects.get(pk=self.user.pk))
+
+    def test_search_fields_required(self):
+        with self.assertRaises(ImproperlyConfigured):
+            SearchSelectWidget()
+
+    def test_not_found(self):
+        # Types without the search widget are not exposed.
+        with self.assertRaises(Http404):
+            self._search(model_name='regpagemodel')
+        with self.assertRaises(Http404):
+            self._search(model_name='urlmodel')
+
+
+class RenderWidgetViewTests(TestCase):
+    """
+    Test the view of the lazy widget.
+    """
+
+    def setUp(self):
+        self.reg = UrlTypeRegistry()
+        self.reg.register(PageModel)
+        self.page = PageModel.objects.create(slug='lazy')
+        self.user = User.objects.create_user('staff', is_staff=True)
+
+    def _render(self, prefix='any_urlfield.pagemodel', user=None, **params):
+        request = RequestFactory().get('/', params)
+        request.user = user or self.user
+        return render_widget(request, prefix, url_type_registry=self.reg)
+
+    def test_render(self):
+        response = self._render(name='form-1-url_2', id='id_form-1-url_2')
+        self.assertHTMLEqual(response.content.decode(), (
+            '<select name="form-1-url_2" id="id_form-1-url_2">'
+            '<option value="" selected>---------</option>'
+            '<option value="{}">lazy</option>'
+            '</select>'
+        ).format(self.page.pk))
+
+    def test_errors(self):
+        with self.assertRaises(PermissionDenied):
+            self._render(user=AnonymousUser(), name='url_2')
+        with self.assertRaises(Http404):
+            self._render(prefix='any_urlfield.unknown', name='url_2')
+        self.assertEqual(self._render().status_code, 400)
+
+    def test_placeholder_url(self):
+        """
+        The placeholder of the lazy widget renders the widget through the view,
+        with the attributes of the form field.
+        """
+        class UrlModelForm(forms.ModelForm):
+            class Meta:
+                model = UrlModel
+                fields = ('url',)
+
+        form = UrlModelForm(initial={'url': AnyUrlValue.from_db_value('http://example.org/')})
+        form.fields['url'].disabled = True
+        form.fields['url'].widget.lazy = True
+        url = unescape(re.search(r'data-url="([^"]+)"', str(form['url'])).group(1))
+
+        self.client.force_login(self.user)
+        response = self.client.get(url + '&' + urlencode({'name': 'url_2', 'id': 'id_url_2'}))
+        self.assertEqual(response.status_code, 200)
+        content = response.content.decode()
+        self.assertIn('name="url_2"', content)
+        self.assertIn('id="id_url_2"', content)
+        self.assertIn('disabled', content)
+
+        # The attributes can't be altered.
+        response = self.client.get(url.replace('attrs=', 'attrs=x') + '&name=url_2')
+        self.assertEqual(response.status_code, 400)
@@ -1,6 +1,7 @@
-from django.urls import path
+from django.urls import include, path
 from django.contrib import admin
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('any_urlfield/', include('any_urlfield.urls')),
 ]
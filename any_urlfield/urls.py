@@ -0,0 +1,10 @@
+from django.urls import path
+
+from any_urlfield import views
+
+app_name = 'any_urlfield'
+
+urlpatterns = [
+    path('widget/<str:prefix>/', views.render_widget, name='render_widget'),
+    path('search/<str:app_label>/<str:model_name>/', views.search, name='search'),
+]
@@ -0,0 +1,152 @@
+"""
+Views used by the URL form widgets.
+"""
+from functools import reduce
+from operator import and_, or_
+
+from django.apps import apps
+from django.core import signing
+from django.core.exceptions import PermissionDenied
+from django.db.models import Q
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, JsonResponse
+
+from any_urlfield.forms.widgets import RENDER_WIDGET_SALT, SearchSelectWidget
+
+SEARCH_LOOKUPS = {
+    '^': 'istartswith',
+    '=': 'iexact',
+    '@': 'search',
+}
+
+
+def render_widget(request, prefix, url_type_registry=None):
+    """
+    Return the HTML of the form widget for a URL type.
+
+    This is used by the lazy :class:`~any_urlfield.forms.AnyUrlWidget`,
+    which only renders the widget of the selected URL type.
+    The ``name`` and ``id`` of the widget are read from the query string,
+    the other attributes of the form field are passed in the signed ``attrs`` parameter.
+    Only staff members have access.
+
+    The view uses the registry of the model field, unless a ``url_type_registry`` is passed in the URLconf.
+    The lazy widget is only used for the model field registry, other registries render all widgets.
+    """
+    if url_type_registry is None:
+        url_type_registry = _get_default_registry()
+
+    if not request.user.is_active or not request.user.is_staff:
+        raise PermissionDenied
+
+    index = url_type_registry.index(prefix)
+    if index is None:
+        raise Http404("URL type not found")
+
+    name = request.GET.get('name')
+    if not name:
+        return HttpResponseBadRequest("Missing name parameter")
+    attrs = {}
+    if request.GET.get('attrs'):
+        try:
+            attrs = signing.loads(request.GET['attrs'], salt=RENDER_WIDGET_SALT)
+        except signing.BadSignature:
+            return HttpResponseBadRequest("Invalid attrs parameter")
+    if request.GET.get('id'):
+        attrs['id'] = request.GET['id']
+
+    # The widgets of the prototype are shared, hence copied like AnyUrlWidget does.
+    widget = url_type_registry.get_form_prototype().copy_widget(index)
+    return HttpResponse(widget.render(name, None, attrs=attrs))
+
+
+def search(request, app_label, model_name, url_type_registry=None):
+    """
+    Return a page of objects for the :class:`~any_urlfield.forms.SearchSelectWidget`.
+
+    The ``term`` and ``page`` parameters are read from the query string.
+    The response uses the format of the select2 library, which is also used by the Django admin:
+    ``{"results": [{"id": ..., "text": ...}], "pagination": {"more": ...}}``.
+    Only staff members that can view or change the objects have access.
+
+    The view uses the registry of the model field, unless a ``url_type_registry`` is passed in the URLconf.
+    """
+    if url_type_registry is None:
+        url_type_registry = _get_default_registry()
+
+    try:
+        model = apps.get_model(app_label, model_name)
+    except LookupError:
+        raise Http404("Model not found")
+
+    url_type = url_type_registry.get_for_model(model)
+    if url_type is None:
+        raise Http404("Model is not registered as URL type")
+
+    index = url_type_registry.index(url_type.prefix)
+    form_field = url_type_registry.get_form_prototype().copy_field(index)
+    widget = form_field.widget
+    if not isinstance(widget, SearchSelectWidget):
+        raise Http404("URL type has no search widget")
+
+    user = request.user
+    opts = model._meta
+    if not user.is_active or not user.is_staff or not (
+            user.has_perm('{}.view_{}'.format(opts.app_label, opts.model_name)) or
+            user.has_perm('{}.change_{}'.format(opts.app_label, opts.model_name))):
+        raise PermissionDenied
+
+    try:
+        page = max(int(request.GET.get('page', 1)), 1)
+    except ValueError:
+        page = 1
+
+    queryset = get_search_results(form_field.queryset, widget.search_fields, request.GET.get('term', ''))
+    if not queryset.ordered:
+        # Pages need a stable ordering.
+        queryset = queryset.order_by('pk')
+
+    # Fetching one more object tells whether there is a next page, without running a COUNT query.
+    offset = (page - 1) * widget.page_size
+    objects = list(queryset[offset:offset + widget.page_size + 1])
+    more = len(objects) > widget.page_size
+
+    return JsonResponse({
+        'results': [
+            {'id': str(obj.pk), 'text': form_field.label_from_instance(obj)}
+            for obj in objects[:widget.page_size]
+        ],
+        'pagination': {'more': more},
+    })
+
+
+def _get_default_registry():
+    from any_urlfield.models import AnyUrlField
+    return AnyUrlField._static_registry
+
+
+def get_search_results(queryset, search_fields, term):
+    """
+    Filter the queryset on the search term, like ``ModelAdmin.get_search_results()`` does.
+    Each word in the term has to match one of the ``search_fields``.
+    """
+    words = term.split()
+    if not words or not search_fields:
+        return queryset
+
+    lookups = []
+    for field_name in search_fields:
+        lookup = SEARCH_LOOKUPS.get(field_name[0])
+        if lookup is not None:
+            field_name = field_name[1:]
+        else:
+            lookup = 'icontains'
+        lookups.append('{}__{}'.format(field_name, lookup))
+
+    queryset = queryset.filter(reduce(and_, (
+        reduce(or_, (Q(**{lookup: word}) for lookup in lookups)) for word in words
+    )))
+
+    if any('__' in field_name.lstrip('^=@') for field_name in search_fields):
+        # Searching relations may return the same object twice.
+        queryset = queryset.distinct()
+    return queryset
@@ -0,0 +1,29 @@
+"""
+Measure the cache key generation, compared to the original ``str.format()`` version.
+"""
+from utils import report, setup_django
+
+setup_django()
+
+from django.utils.translation import get_language  # noqa: E402
+
+from any_urlfield.cache import get_urlfield_cache_key, get_urlfield_cache_keys  # noqa: E402
+from any_urlfield.tests import PageModel  # noqa: E402
+
+
+def format_cache_key(model, pk, language_code=None):
+    # The previous implementation
+    return 'anyurlfield.{}.{}.{}.{}'.format(model._meta.app_label, model.__name__, pk, language_code or get_language())
+
+
+def main():
+    pks = list(range(100))
+    report("str.format() key, active language", lambda: format_cache_key(PageModel, 12))
+    report("get_urlfield_cache_key(), active language", lambda: get_urlfield_cache_key(PageModel, 12))
+    report("get_urlfield_cache_key(), given language", lambda: get_urlfield_cache_key(PageModel, 12, 'en'))
+    report("str.format() keys, 100 pks", lambda: [format_cache_key(PageModel, pk) for pk in pks], number=100)
+    report("get_urlfield_cache_keys(), 100 pks", lambda: get_urlfield_cache_keys(PageModel, pks), number=100)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""
+Measure the construction of forms with an ``AnyUrlField``, for a registry with many URL types.
+"""
+from utils import report, setup_django
+
+setup_django()
+
+from django import forms  # noqa: E402
+from django.db import models  # noqa: E402
+
+import any_urlfield.forms  # noqa: E402
+from any_urlfield.registry import UrlTypeRegistry  # noqa: E402
+
+NUM_URL_TYPES = 20
+NUM_FORMS = 50
+
+
+def create_models():
+    return [
+        type('BenchPage{}'.format(i), (models.Model,), {
+            '__module__': 'any_urlfield.tests',
+            'slug': models.SlugField(),
+        })
+        for i in range(NUM_URL_TYPES)
+    ]
+
+
+def create_registry(bench_models, form_field_instance=False):
+    registry = UrlTypeRegistry()
+    for model in bench_models:
+        if form_field_instance:
+            # A form field instance is shared, and copied by each form.
+            registry.register(model, form_field=forms.ModelChoiceField(queryset=model._default_manager.all()))
+        else:
+            # The default form field is built for each form.
+            registry.register(model)
+    return registry
+
+
+def measure(name, registry):
+    class ExampleForm(forms.Form):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            # Built per form, like forms that depend on the request do.
+            self.fields['url'] = any_urlfield.forms.AnyUrlField(url_type_registry=registry)
+
+    ExampleFormSet = forms.formset_factory(ExampleForm, extra=NUM_FORMS)
+
+    report("AnyUrlField(), " + name, lambda: any_urlfield.forms.AnyUrlField(url_type_registry=registry), number=100)
+    report("formset construction, " + name, lambda: ExampleFormSet().forms, number=5)
+
+
+def main():
+    bench_models = create_models()
+    print("{} URL types, {} forms:".format(NUM_URL_TYPES, NUM_FORMS))
+    measure("default form_field", create_registry(bench_models))
+    measure("form_field instance", create_registry(bench_models, form_field_instance=True))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""
+Compare the 'delete' and 'generation' cache invalidation strategies for bulk saves,
+and write-through with and without reading the cached languages first.
+"""
+import time
+from unittest import mock
+
+from utils import setup_django
+
+setup_django(create_db=True)
+
+from django.conf import settings  # noqa: E402
+from django.core.cache import caches  # noqa: E402
+from django.utils import translation  # noqa: E402
+
+from any_urlfield.models import AnyUrlValue  # noqa: E402
+
+from any_urlfield.tests import RegPageModel  # noqa: E402
+
+NUM_OBJECTS = 1000
+
+
+class CountingCache:
+    """
+    Count the cache calls and keys that reach the backend.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.calls = 0
+        self.keys = 0
+
+    def __getattr__(self, name):
+        method = getattr(self.backend, name)
+
+        def _wrapper(key_or_keys, *args, **kwargs):
+            self.calls += 1
+            self.keys += 1 if isinstance(key_or_keys, str) else len(key_or_keys)
+            return method(key_or_keys, *args, **kwargs)
+
+        return _wrapper
+
+
+def measure(strategy, pages, write_through=False, cached_languages_only=False):
+    counter = CountingCache(caches['default'])
+    with mock.patch('any_urlfield.appsettings.ANY_URLFIELD_CACHE_INVALIDATION', strategy), \
+            mock.patch('any_urlfield.appsettings.ANY_URLFIELD_CACHE_WRITE_THROUGH', write_through), \
+            mock.patch('any_urlfield.appsettings.ANY_URLFIELD_CACHE_WRITE_CACHED_LANGUAGES_ONLY', cached_languages_only), \
+            mock.patch('any_urlfield.cache.UrlCache.backend', counter):
+        start = time.perf_counter()
+        for page in pages:
+            page.save()
+        duration = time.perf_counter() - start
+
+    name = strategy + (' + write-through' if write_through else '') + (' + cached languages' if cached_languages_only else '')
+    print("{:<44} {:>8.1f} ms, {:>6} cache calls, {:>7} cache keys".format(
+        name, duration * 1000, counter.calls, counter.keys
+    ))
+
+
+def main():
+    pages = [RegPageModel.objects.create(slug='page{}'.format(i)) for i in range(NUM_OBJECTS)]
+    print("Saving {} objects, with {} languages configured:".format(NUM_OBJECTS, len(settings.LANGUAGES)))
+    measure('delete', pages)
+    measure('generation', pages)
+
+    measure('delete', pages, write_through=True)
+
+    # Render the URLs in 2 languages first, these are the cached languages.
+    for language in ('en', 'nl'):
+        with translation.override(language):
+            AnyUrlValue.render_urls([AnyUrlValue.from_model(page) for page in pages])
+    measure('delete', pages, write_through=True, cached_languages_only=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+"""
+Measure the memory usage of many loaded ``AnyUrlValue`` objects.
+"""
+import tracemalloc
+
+from utils import setup_django
+
+setup_django()
+
+from any_urlfield.models import AnyUrlValue  # noqa: E402
+from any_urlfield.registry import UrlTypeRegistry  # noqa: E402
+from any_urlfield.tests import PageModel  # noqa: E402
+
+NUM_VALUES = 100000
+
+
+def measure(title, db_values, registry):
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    values = [AnyUrlValue.from_db_value(db_value, registry) for db_value in db_values]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    size = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+    size -= len(values) * 8  # the list itself
+    print("{:<30} {:>8.1f} bytes/value ({:.1f} MB for {} values)".format(
+        title, size / len(values), size / 1024 / 1024, len(values)
+    ))
+
+
+def main():
+    registry = UrlTypeRegistry()
+    registry.register(PageModel)
+
+    # Use distinct values, so integers are allocated too.
+    measure("ID values", ['any_urlfield.pagemodel://{}'.format(i) for i in range(NUM_VALUES)], registry)
+    measure("External URLs", ['http://example.com/{}/'.format(i) for i in range(NUM_VALUES)], registry)
+
+
+if __name__ == '__main__':
+    main()
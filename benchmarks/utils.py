@@ -0,0 +1,35 @@
+"""
+Shared setup for the benchmark scripts.
+
+The benchmarks reuse the settings of ``runtests.py``, run them from the project root::
+
+    python benchmarks/bench_memory.py
+"""
+import sys
+import timeit
+from os import path
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+
+def setup_django(create_db=False):
+    """
+    Configure Django with the test settings, and optionally create the test database.
+    """
+    import django
+    import runtests  # noqa, configures the settings
+
+    django.setup()
+    if create_db:
+        from django.db import connection
+
+        import any_urlfield.tests  # noqa, the models for the test database
+        connection.creation.create_test_db(verbosity=0)
+
+
+def report(title, func, number=1000, repeat=5):
+    """
+    Print the best timing of a function.
+    """
+    best = min(timeit.repeat(func, number=number, repeat=repeat))
+    print("{:<50} {:>10.2f} us/call".format(title, best / number * 1e6))
@@ -28,6 +28,16 @@ if not settings.configured:
                 'NAME': ':memory:'
             }
         },
+        CACHES = {
+            'default': {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                'OPTIONS': {'MAX_ENTRIES': 10000},  # for the benchmarks
+            },
+            'urls': {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                'LOCATION': 'urls',
+            },
+        },
         INSTALLED_APPS = (
             'django.contrib.admin',
             'django.contrib.auth',
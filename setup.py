@@ -40,6 +40,7 @@ setup(
     requires=[
         'Django (>=2.2)',
     ],
+    python_requires='>=3.7',
 
     description='An improved URL selector to choose between internal models and external URLs',
     long_description=read('README.rst'),
@@ -64,7 +65,6 @@ setup(
         'License :: OSI Approved :: Apache Software License',
         'Operating System :: OS Independent',
         'Programming Language :: Python',
-        'Programming Language :: Python :: 3.6',
         'Programming Language :: Python :: 3.7',
         'Programming Language :: Python :: 3.8',
         'Framework :: Django',